@@ -1,50 +1,57 @@
 # SPDX-License-Identifier: MIT
 
-import json
+import os
+import sys
 
-FILE_PATH = ''
+# The shared helpers live in utils/ at the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.jsonl import iter_jsonl_bytes, loads
 
-# Prepare accumulators for input lengths and scores.
-base_lengths = {'MBPP_base': [], 'HE_base': []}
-plus_lengths = {'MBPP_plus': [], 'HE_plus': []}
-ground_scores = {'MBPP_base': [], 'HE_base': [], 'MBPP_plus': [], 'HE_plus': []}
+FILE_PATH = ''
 
-with open(FILE_PATH, 'r') as f:
-    for line in f:
-        entry = json.loads(line)
+# Prepare running sums and counts for input lengths and scores.
+base_length_sum = {'MBPP_base': 0, 'HE_base': 0}
+base_length_cnt = {'MBPP_base': 0, 'HE_base': 0}
+plus_length_sum = {'MBPP_plus': 0, 'HE_plus': 0}
+plus_length_cnt = {'MBPP_plus': 0, 'HE_plus': 0}
+ground_sum = {'MBPP_base': 0.0, 'HE_base': 0.0, 'MBPP_plus': 0.0, 'HE_plus': 0.0}
+ground_cnt = {'MBPP_base': 0, 'HE_base': 0, 'MBPP_plus': 0, 'HE_plus': 0}
+
+with open(FILE_PATH, 'rb') as f:
+    for line in iter_jsonl_bytes(f):
+        entry = loads(line)
         dataset = entry.get('dataset')
         score = entry.get('ground_average_test_score')
 
         # Bucket ground scores by dataset type.
-        if dataset in ground_scores:
-            ground_scores[dataset].append(score)
+        if dataset in ground_sum:
+            ground_sum[dataset] += score
+            ground_cnt[dataset] += 1
 
         # For base datasets, count length of "base_inputs"
 
         # base_inputs = entry["all_solutions"][0].get('base_input', [])
-        # base_lengths[dataset].append(len(base_inputs))
+        # base_length_sum[dataset] += len(base_inputs)
+        # base_length_cnt[dataset] += 1
         # For plus datasets, count length of "plus_inputs"
-        plus_inputs = entry.get('plus_input') + entry.get('base_input')
-        print(plus_inputs)
-        break
-        plus_lengths['MBPP_plus'].append(len(plus_inputs))
-
-print(plus_lengths)
+        plus_inputs = entry.get('plus_input', []) + entry.get('base_input', [])
+        plus_length_sum['MBPP_plus'] += len(plus_inputs)
+        plus_length_cnt['MBPP_plus'] += 1
 
-def average(lst):
-    return sum(lst) / len(lst) if lst else 0
+def average(total, count):
+    return total / count if count else 0
 
 print("=== Average Base Input Lengths ===")
-for key, lengths in base_lengths.items():
-    avg = average(lengths)
-    print(f"{key}: {avg:.2f} (n={len(lengths)})")
+for key, total in base_length_sum.items():
+    avg = average(total, base_length_cnt[key])
+    print(f"{key}: {avg:.2f} (n={base_length_cnt[key]})")
 
 print("\n=== Average Plus Input Lengths ===")
-for key, lengths in plus_lengths.items():
-    avg = average(lengths)
-    print(f"{key}: {avg:.2f} (n={len(lengths)})")
+for key, total in plus_length_sum.items():
+    avg = average(total, plus_length_cnt[key])
+    print(f"{key}: {avg:.2f} (n={plus_length_cnt[key]})")
 
 print("\n=== Ground Average Test Score (Bucketed) ===")
-for key, scores in ground_scores.items():
-    avg = average(scores)
-    print(f"{key}: {avg:.2f} (n={len(scores)})")
+for key, total in ground_sum.items():
+    avg = average(total, ground_cnt[key])
+    print(f"{key}: {avg:.2f} (n={ground_cnt[key]})")
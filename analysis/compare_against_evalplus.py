@@ -1,8 +1,13 @@
 # SPDX-License-Identifier: MIT
 
-import json
+import os
+import sys
+
 from evalplus.evaluate import evaluate
 
+# The shared helpers live in utils/ at the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.jsonl import dumps, iter_jsonl_bytes, loads, needs_json
 
 input_file = ''
 output_file = ''
@@ -13,12 +18,10 @@ plus_number_correct = 0
 
 total_number = 0.0
 
-output = open(output_file, 'w')
-
-with open(input_file, 'r') as f:
-    lines = f.readlines()
-    for line in lines:
-        line = json.loads(line.strip())
+# The rewritten samples are flushed and closed before evaluate() reads them back.
+with open(input_file, 'rb') as f, open(output_file, 'wb', buffering=1 << 20) as output:
+    for raw in iter_jsonl_bytes(f):
+        line = loads(raw)
 
         if line['base_execution_result']['average_test_score'] == 1.0:
             base_number_correct += 1.0
@@ -39,7 +42,8 @@ with open(input_file, 'r') as f:
         if is_mbpp:
             line['task_id'] = "Mbpp/" + str(line['task_id'])
 
-        output.write(json.dumps(line) + '\n')
+        # Non-finite test inputs are only written back exactly by json.
+        output.write(dumps(line, use_json=needs_json(raw)))
 
 
 print(f"Base number correct: {float(base_number_correct) / total_number}")
@@ -1,190 +1,244 @@
 # SPDX-License-Identifier: MIT
 
 import argparse
-import json
 import glob
+import math
 import os
-from collections import defaultdict
-
-TIME_RATIO_THRESHOLD = 1.0
+from contextlib import ExitStack
+from functools import partial
+from itertools import chain, islice
+from multiprocessing import Pool
+
+from utils.jsonl import dumps, iter_jsonl_bytes, loads, needs_json
+from combine_solutions_core import (
+    BASE_KEY,
+    PLUS_KEY,
+    SCORE_KEY,
+    TIME_KEY,
+    add_scores,
+    all_stderrs_nonempty,
+    clean_solution_body,
+    rank_dimension,
+    weighted_plus_score,
+)
+
+WRITE_BUFFER_SIZE = 1 << 20
+IMAP_CHUNKSIZE = 64
+# Pool.imap consumes its whole input up front, so tasks are handed to the pool in windows of
+# this many chunks per worker to keep the lines read ahead bounded.
+IMAP_WINDOW_CHUNKS = 4
+
+# Keys of the original line left out of the unranked and ranked entries.
+UNRANKED_DROP_KEYS = frozenset({"base_input", "plus_input"})
+RANKED_DROP_KEYS = UNRANKED_DROP_KEYS | {BASE_KEY, PLUS_KEY}
 
 ###############################################################################
 # Helpers
 ###############################################################################
 
-def get_test_score(sol, dim):
+def has_inf_time(solutions):
     """
-    Retrieve test_score from sol[dim + "_execution_result"]["average_test_score"].
-    Returns 0.0 if missing or invalid.
+    Returns True if any solution carries the float('inf') average_time_taken sentinel.
+    orjson serializes non-finite floats as null, so such lines are written with json instead.
+    The sentinel is filled in while cleaning, so it does not show up in the raw input lines.
     """
-    if not sol:
-        return 0.0
-    res = sol.get(dim + "_execution_result", {})
-    return float(res["average_test_score"])
+    for s in solutions:
+        for exec_key in (BASE_KEY, PLUS_KEY):
+            res = s["solution"].get(exec_key)
+            if res and math.isinf(res.get(TIME_KEY, 0.0)):
+                return True
+    return False
 
-def get_time_taken(sol, dim):
+def append_line(buf, obj, use_json=False):
     """
-    Retrieve time_taken from sol[dim + "_execution_result"]["average_time_taken"].
-    Returns float('inf') if missing (so that it is considered 'worst').
+    Serialize obj as a single newline-terminated JSONL line onto the bytearray buf.
     """
-    if not sol:
-        return float('inf')
-    res = sol.get(dim + "_execution_result", {})
-    if "average_time_taken" in res:
-        return res["average_time_taken"]
-    times = res.get("time_taken", [])
-    if not times:
-        return float('inf')
-    return sum(times) / len(times)
-
-def rank_dimension(solutions, dim, original_id):
-    """
-    Rank solutions by `test_score` (descending) for the given dimension ('base' or 'plus'),
-    with tie-breaking via *pairwise* time ratio (<2.0 => discard the worse [bigger time]).
+    buf += dumps(obj, use_json)
 
-    The solution with id == original_id is forced rank=1 and never discarded.
-    Returns: dict of solution_id -> rank (int),
-             solutions not in the final ranking are omitted.
+def read_lines(input_lines, solution_lines):
     """
+    Yield (index, original line, candidate lines) from the row-aligned input and exec line iterators.
+    Candidates from exec files that have run out of lines are None.
+    """
+    for i, original_raw in enumerate(input_lines):
+        yield i, original_raw, [next(lines, None) for lines in solution_lines]
 
-    # Separate out the forced original solution
-    forced_original = None
-    others = []
-    for s in solutions:
-        if s["id"] == original_id:
-            forced_original = s
-        else:
-            others.append(s)
-    
-    # --- 1) Group 'others' by their test_score for this dimension ---
-    score_map = defaultdict(list)
-    for sol in others:
-        score = get_test_score(sol["solution"], dim)
-        if dim == "plus":
-            score = (score * len(sol["solution"].get("plus_input", [])) + get_test_score(sol["solution"], "base") * len(sol["solution"]["base_input"])) / (len(sol["solution"].get("plus_input", [])) + len(sol["solution"]["base_input"]))
-        score_map[score].append(sol)
-
-    # We will collect survivors here:
-    final_survivors = []
-
-    # --- 2) For each test_score group, do pairwise checks ---
-    for score, group in score_map.items():
-        # If forced_original has this same test_score, treat it as in this group (so it can never be removed)
-        in_this_group = group[:]
-        if forced_original is not None:
-            fo_score = get_test_score(forced_original["solution"], dim)
-            if abs(fo_score - score) < 1e-20:
-                # forced original is effectively part of this tie group
-                in_this_group.append(forced_original)
-        # We'll repeatedly compare solutions pairwise until no more can be removed.
-        changed = True
-        while changed:
-            changed = False
-            i = 0
-            while i < len(in_this_group):
-                s1 = in_this_group[i]
-                t1 = get_time_taken(s1["solution"], dim)
-                j = i + 1
-                while j < len(in_this_group):
-                    s2 = in_this_group[j]
-                    t2 = get_time_taken(s2["solution"], dim)
-                    # Check if they have essentially the same test_score:
-                    score_s1 = get_test_score(s1["solution"], dim)
-                    score_s2 = get_test_score(s2["solution"], dim)
-                    if abs(score_s1 - score_s2) < 1e-9:
-                        bigger = s1 if t1 > t2 else s2
-                        ratio = (max(t1, t2) / min(t1, t2)) if min(t1, t2) > 0 else float('inf')
-                        # If ratio < 2 => discard the bigger-time solution unless it is forced_original
-                        if ratio < TIME_RATIO_THRESHOLD:
-                            if bigger["id"] != original_id:
-                                in_this_group.remove(bigger)
-                                changed = True
-                                # Because we removed bigger, adjust indices accordingly:
-                                if bigger is s1:
-                                    j -= 1
-                                    s1 = None
-                                    break
-                                else:
-                                    j -= 1
-                            else:
-                                # forced_original is the bigger one => do NOT discard it
-                                pass
-                        else:
-                            # ratio >= 2 => keep both
-                            pass
-                    j += 1
-                i += 1
-        
-        # After tie-breaking is done for this group, add survivors (except duplicates of forced original)
-        for s in in_this_group:
-            if s is not forced_original:
-                final_survivors.append(s)
-
-    # Ensure forced_original is in final_survivors
-    if forced_original is not None and forced_original not in final_survivors:
-        final_survivors.append(forced_original)
-
-    # --- 3) Sort final survivors by test_score (descending) ---
-    final_survivors.sort(key=lambda x: get_test_score(x["solution"], dim), reverse=True)
-
-    # --- 4) Build the final ranking ---
-    result = {}
-    result[original_id] = 1
-    rank_counter = 2
-    for s in final_survivors:
-        sid = s["id"]
-        if sid != original_id:
-            result[sid] = rank_counter
-            rank_counter += 1
-
-    return result
-
-def clean_solution(sol):
+def iter_windows(tasks, size):
     """
-    Remove unwanted keys from top level (base_input, plus_input),
-    and from base_execution_results & plus_execution_results:
-      time_taken, unit_test_stderrs, unit_test_stdouts, correct_tests, traceback.
-    Modifies 'sol' in place and returns it.
+    Yield lists of at most size consecutive tasks.
     """
-    sol.pop("base_input", None)
-    sol.pop("plus_input", None)
-    
-    # If there's a "solution" key that contains base/plus execution results, remove sub-keys
-    if "solution" in sol and sol["solution"]:
-        for dim in ["base", "plus"]:
-            exec_key = dim + "_execution_result"
-            if exec_key in sol["solution"]:
-                # Fill average_time_taken if missing
-                if "average_time_taken" not in sol["solution"][exec_key]:
-                    times = sol["solution"][exec_key].get("time_taken", [])
-                    if times:
-                        sol["solution"][exec_key]["average_time_taken"] = sum(times) / len(times)
-                    else:
-                        sol["solution"][exec_key]["average_time_taken"] = float('inf')
-                for k in ["time_taken", "unit_test_stderrs", "unit_test_stdouts", "correct_tests", "traceback"]:
-                    sol["solution"][exec_key].pop(k, None)
-    return sol
+    while window := list(islice(tasks, size)):
+        yield window
 
-def all_stderrs_nonempty(sol):
+def process_line(task, dataset_type, solution_files):
     """
-    Returns True if **all** stderr lines in base_execution_result['unit_test_stderrs']
-    + plus_execution_result['unit_test_stderrs'] are non-empty strings.
-    Otherwise returns False.
+    Filter, rank and serialize one input line together with its candidate solutions.
+    Returns: ((unranked, ranked, base, plus) JSONL lines, number of tossed solutions).
     """
-    base_stderrs = sol["solution"]["base_execution_result"]["unit_test_stderrs"]
-    if "plus_execution_result" in sol["solution"]:
-        plus_stderrs = sol["solution"]["plus_execution_result"]["unit_test_stderrs"]
+    i, original_raw, candidate_raws = task
+    line_unranked, line_ranked, line_base, line_plus = bytearray(), bytearray(), bytearray(), bytearray()
+    tossed_solutions = 0
+
+    original_line = loads(original_raw)
+
+    # --------------------------------------------
+    #  Build the list of solutions (including original)
+    # --------------------------------------------
+    # Validate that the original line contains a prompt.
+    if dataset_type != "MBPP":
+        original_prompt = original_line.get("prompt")
+        if original_prompt is None:
+            print(f"Original solution at line {i} does not contain a 'prompt' key.")
     else:
-        plus_stderrs = []
-    
-    combined = base_stderrs + plus_stderrs
-    if not combined:
-        return False
-    
-    for line in combined:
-        if not line.strip() or line.strip() == "AssertionError()":
-            return False
-    return True
+        original_prompt = original_line.get("text")
+        if original_prompt is None:
+            print(f"Original solution at line {i} does not contain a 'text' key.")
+
+
+    all_solutions = []
+    original_sol = {
+        "id": 0,
+        "solution": original_line
+    }
+    all_solutions.append(original_sol)
+
+    # Zip the solution filenames with their handles for better error messages.
+    current_id = 1
+    for sf, candidate_raw in zip(solution_files, candidate_raws):
+        if candidate_raw is not None:
+            candidate = loads(candidate_raw)
+            if dataset_type != "MBPP":
+                if candidate.get("prompt") != original_prompt:
+                    print(f"Prompt mismatch in file {sf} at line {i} for solution id {current_id}.")
+            else:
+                if candidate.get("text") != original_prompt:
+                    if candidate.get("text").startswith(original_prompt):
+                        candidate["text"] = original_prompt
+                    else:
+                        print(f"Prompt mismatch in file {sf} at line {i} for solution id {current_id}.")
+            all_solutions.append({
+                "id": current_id,
+                "solution": candidate
+            })
+        current_id += 1
+
+    # ---------------------------------------------------
+    #  Filter solutions that have all stderr lines non-empty
+    #  If forced original (id=0) meets this condition, crash
+    # ---------------------------------------------------
+    # Surviving solutions are cleaned and scored in the same pass. Their bodies are shared by
+    # every output file, so they are cleaned exactly once here.
+    dims = ["base"] if dataset_type == "MBPP" else ["base", "plus"]
+    scores = {}
+    filtered_solutions = []
+    for s in all_solutions:
+        if all_stderrs_nonempty(s):
+            if s["id"] == 0:
+                raise RuntimeError(
+                    "Original solution (id=0) has all stderr lines non-empty. "
+                    "Crashing as requested."
+                )
+            tossed_solutions += 1
+            continue
+        clean_solution_body(s["solution"])
+        add_scores(scores, s, dims)
+        filtered_solutions.append(s)
+
+    all_solutions = filtered_solutions
+
+    # -----------------
+    # 1) Unranked file
+    # -----------------
+    unranked_entry = {k: v for k, v in original_line.items() if k not in UNRANKED_DROP_KEYS}
+    unranked_entry["all_solutions"] = all_solutions
+
+    # Test inputs can hold integers wider than 64 bits and non-finite floats (e.g. Mbpp/404),
+    # which only json writes back exactly.
+    use_json = (
+        needs_json(original_raw)
+        or any(raw is not None and needs_json(raw) for raw in candidate_raws)
+        or has_inf_time(all_solutions)
+    )
+    append_line(line_unranked, unranked_entry, use_json)
+
+    # -----------------
+    # 2) Ranked file
+    # -----------------
+    base_ranks = rank_dimension(all_solutions, "base", original_id=0, scores=scores)
+    if dataset_type != "MBPP":
+        plus_ranks = rank_dimension(all_solutions, "plus", original_id=0, scores=scores)
+    else:
+        plus_ranks = {}
+
+    final_solutions = []
+    for s in all_solutions:
+        sid = s["id"]
+        s_base_rank = base_ranks.get(sid, None)
+        s_plus_rank = plus_ranks.get(sid, None)
+        final_solutions.append({
+            "rank": {
+                "base_execution": s_base_rank,
+                "plus_execution": s_plus_rank
+            },
+            "solution": s["solution"]
+        })
+
+    # Shared by the ranked, base and plus entries; each adds its own all_solutions.
+    ranked_meta = {k: v for k, v in original_line.items() if k not in RANKED_DROP_KEYS}
+    ranked_entry = {**ranked_meta, "all_solutions": final_solutions}
+
+    # The ranked, base and plus files are all assembled in a single pass over the solutions.
+    base_solutions = []
+    plus_solutions = []
+    for sol_dict in ranked_entry["all_solutions"]:
+        base_result = sol_dict["solution"].pop(BASE_KEY)
+        base_score = base_result[SCORE_KEY]
+        base_time = base_result[TIME_KEY]
+        if dataset_type != "MBPP":
+            plus_result = sol_dict["solution"].pop(PLUS_KEY)
+            plus_score = weighted_plus_score(sol_dict["solution"], plus_result[SCORE_KEY], base_score)
+            plus_time = plus_result[TIME_KEY]
+        else:
+            plus_score = None
+            plus_time = None
+        sol_dict["average_test_score"] = {
+            "base_execution": base_score,
+            "plus_execution": plus_score
+        }
+        sol_dict["average_time_taken"] = {
+            "base_execution": base_time,
+            "plus_execution": plus_time
+        }
+
+        b_rank = sol_dict["rank"]["base_execution"]
+        if b_rank is not None:
+            base_solutions.append({
+                "rank": b_rank,
+                "average_test_score": round(base_score, 2),
+                "average_time_taken": base_time,
+                "solution": sol_dict["solution"]
+            })
+        p_rank = sol_dict["rank"]["plus_execution"]
+        if p_rank is not None:
+            plus_solutions.append({
+                "rank": p_rank,
+                "average_test_score": round(plus_score, 2),
+                "average_time_taken": plus_time,
+                "solution": sol_dict["solution"]
+            })
+
+    append_line(line_ranked, ranked_entry, use_json)
+
+    # -------------------------------------------------------------
+    # 3) Additional base/plus files with filtered all_solutions
+    # -------------------------------------------------------------
+    base_solutions.sort(key=lambda x: x["rank"])
+    append_line(line_base, {**ranked_meta, "all_solutions": base_solutions}, use_json)
+
+    plus_solutions.sort(key=lambda x: x["rank"])
+    append_line(line_plus, {**ranked_meta, "all_solutions": plus_solutions}, use_json)
+
+    return (line_unranked, line_ranked, line_base, line_plus), tossed_solutions
 
 ###############################################################################
 # Main Script
@@ -201,6 +255,8 @@ def main():
                         help='Path to the input directory containing scored solutions.')
     parser.add_argument('--output_dir', type=str, required=True,
                         help='Path to the output directory.')
+    parser.add_argument('--num_workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes used to process lines in parallel.')
     
     args = parser.parse_args()
 
@@ -208,6 +264,7 @@ def main():
     input_file = args.input_file
     input_dir = args.input_dir
     output_dir = args.output_dir
+    num_workers = args.num_workers
 
     output_file_unranked = f"{output_dir}/{dataset_type}_unranked.jsonl"
     output_file_ranked = f"{output_dir}/{dataset_type}_ranked.jsonl"
@@ -218,200 +275,46 @@ def main():
     # Collect all solution filenames of form exec_*.jsonl
     solution_files = sorted(glob.glob(os.path.join(input_dir, "exec_*.jsonl")))
     
-    # Read input lines
-    with open(input_file, "r", encoding="utf-8") as fin:
-        input_lines = [json.loads(line.strip()) for line in fin]
-    
-    # Read lines from each solution file
-    solutions_per_file = []
-    for sf in solution_files:
-        with open(sf, "r", encoding="utf-8") as f:
-            solutions_per_file.append([json.loads(l.strip()) for l in f])
-    
-    with open(output_file_unranked, "w", encoding="utf-8") as f_unranked, \
-         open(output_file_ranked, "w", encoding="utf-8") as f_ranked, \
-         open(output_file_base, "w", encoding="utf-8") as f_base, \
-         open(output_file_plus, "w", encoding="utf-8") as f_plus:
+    # Input and solution files are row-aligned, so stream them line by line in lockstep
+    # instead of loading every file into memory up front.
+    with ExitStack() as stack:
+        fin = stack.enter_context(open(input_file, "rb"))
+        solution_handles = [stack.enter_context(open(sf, "rb")) for sf in solution_files]
+
+        f_unranked = stack.enter_context(open(output_file_unranked, "wb", buffering=WRITE_BUFFER_SIZE))
+        f_ranked = stack.enter_context(open(output_file_ranked, "wb", buffering=WRITE_BUFFER_SIZE))
+        f_base = stack.enter_context(open(output_file_base, "wb", buffering=WRITE_BUFFER_SIZE))
+        f_plus = stack.enter_context(open(output_file_plus, "wb", buffering=WRITE_BUFFER_SIZE))
+
+        # Lines are batched per output file and written once a batch exceeds WRITE_BUFFER_SIZE.
+        buf_unranked, buf_ranked, buf_base, buf_plus = bytearray(), bytearray(), bytearray(), bytearray()
+        outputs = [(f_unranked, buf_unranked), (f_ranked, buf_ranked), (f_base, buf_base), (f_plus, buf_plus)]
+
+        worker = partial(process_line, dataset_type=dataset_type, solution_files=solution_files)
+        tasks = read_lines(iter_jsonl_bytes(fin), [iter_jsonl_bytes(handle) for handle in solution_handles])
+        # Lines are independent, so they are processed in parallel and written back in input order.
+        if num_workers > 1:
+            pool = stack.enter_context(Pool(num_workers))
+            window_size = IMAP_WINDOW_CHUNKS * num_workers * IMAP_CHUNKSIZE
+            results = chain.from_iterable(pool.imap(worker, window, chunksize=IMAP_CHUNKSIZE)
+                                          for window in iter_windows(tasks, window_size))
+        else:
+            results = map(worker, tasks)
 
         tossed_solutions = 0
-        
-        for i, original_line in enumerate(input_lines):
+        for i, (lines, tossed) in enumerate(results):
             if i % 25 == 0:
                 print(f"Processing line {i}...")
+            tossed_solutions += tossed
 
-            # --------------------------------------------
-            #  Build the list of solutions (including original)
-            # --------------------------------------------
-            # Validate that the original line contains a prompt.
-            if dataset_type != "MBPP":
-                original_prompt = original_line.get("prompt")
-                if original_prompt is None:
-                    print(f"Original solution at line {i} does not contain a 'prompt' key.")
-            else:
-                original_prompt = original_line.get("text")
-                if original_prompt is None:
-                    print(f"Original solution at line {i} does not contain a 'text' key.")
-
-
-            all_solutions = []
-            original_sol = {
-                "id": 0,
-                "solution": original_line
-            }
-            all_solutions.append(original_sol)
-            
-            # Zip the solution filenames with their corresponding lists for better error messages.
-            current_id = 1
-            for sf, sol_file_lines in zip(solution_files, solutions_per_file):
-                if i < len(sol_file_lines):
-                    candidate = sol_file_lines[i]
-                    if dataset_type != "MBPP":
-                        if candidate.get("prompt") != original_prompt:
-                            print(f"Prompt mismatch in file {sf} at line {i} for solution id {current_id}.")
-                    else:
-                        if candidate.get("text") != original_prompt:
-                            if candidate.get("text").startswith(original_prompt):
-                                candidate["text"] = original_prompt
-                            else:
-                                print(f"Prompt mismatch in file {sf} at line {i} for solution id {current_id}.")
-                    all_solutions.append({
-                        "id": current_id,
-                        "solution": candidate
-                    })
-                current_id += 1
-
-            # ---------------------------------------------------
-            #  Filter solutions that have all stderr lines non-empty
-            #  If forced original (id=0) meets this condition, crash
-            # ---------------------------------------------------
-            filtered_solutions = []
-            for s in all_solutions:
-                if all_stderrs_nonempty(s):
-                    if s["id"] == 0:
-                        raise RuntimeError(
-                            "Original solution (id=0) has all stderr lines non-empty. "
-                            "Crashing as requested."
-                        )
-                    tossed_solutions += 1
-                else:
-                    filtered_solutions.append(s)
-
-            all_solutions = filtered_solutions
-
-            # -----------------
-            # 1) Unranked file
-            # -----------------
-            unranked_entry = dict(original_line)
-            unranked_entry.pop("base_input", None)
-            unranked_entry.pop("plus_input", None)
-
-            unranked_entry["all_solutions"] = all_solutions
-
-            clean_solution(unranked_entry)
-            for sol_obj in unranked_entry["all_solutions"]:
-                tmp = {"solution": sol_obj["solution"]}
-                clean_solution(tmp)
-                sol_obj["solution"] = tmp["solution"]
-
-            f_unranked.write(json.dumps(unranked_entry) + "\n")
-            
-            # -----------------
-            # 2) Ranked file
-            # -----------------
-            base_ranks = rank_dimension(all_solutions, "base", original_id=0)
-            if dataset_type != "MBPP":
-                plus_ranks = rank_dimension(all_solutions, "plus", original_id=0)
-            else:
-                plus_ranks = {}
-            
-            final_solutions = []
-            for s in all_solutions:
-                sid = s["id"]
-                s_base_rank = base_ranks.get(sid, None)
-                s_plus_rank = plus_ranks.get(sid, None)
-                final_solutions.append({
-                    "rank": {
-                        "base_execution": s_base_rank,
-                        "plus_execution": s_plus_rank
-                    },
-                    "solution": s["solution"]
-                })
-            
-            ranked_entry = dict(original_line)
-            ranked_entry.pop("base_input", None)
-            ranked_entry.pop("plus_input", None)
-            ranked_entry.pop("base_execution_result", None)
-            ranked_entry.pop("plus_execution_result", None)
-            ranked_entry["all_solutions"] = final_solutions
-            
-            clean_solution(ranked_entry)
-            for sol_dict in ranked_entry["all_solutions"]:
-                tmp = {"solution": sol_dict["solution"]}
-                clean_solution(tmp)
-                sol_dict["solution"] = tmp["solution"]
-
-                if dataset_type != "MBPP":
-                    sol_dict["average_test_score"] = {
-                        "base_execution": sol_dict["solution"]["base_execution_result"]["average_test_score"],
-                        "plus_execution": (sol_dict["solution"]["plus_execution_result"]["average_test_score"] * len(sol_dict["solution"]["plus_input"]) + sol_dict["solution"]["base_execution_result"]["average_test_score"] * len(sol_dict["solution"]["base_input"])) / (len(sol_dict["solution"]["plus_input"]) + len(sol_dict["solution"]["base_input"]))
-                    }
-                    sol_dict["average_time_taken"] = {
-                        "base_execution": sol_dict["solution"]["base_execution_result"]["average_time_taken"],
-                        "plus_execution": sol_dict["solution"]["plus_execution_result"]["average_time_taken"]
-                    }
-                    del sol_dict["solution"]["base_execution_result"]
-                    del sol_dict["solution"]["plus_execution_result"]
-                else:
-                    sol_dict["average_test_score"] = {
-                        "base_execution": sol_dict["solution"]["base_execution_result"]["average_test_score"],
-                        "plus_execution": None
-                    }
-                    sol_dict["average_time_taken"] = {
-                        "base_execution": sol_dict["solution"]["base_execution_result"]["average_time_taken"],
-                        "plus_execution": None
-                    }
-                    del sol_dict["solution"]["base_execution_result"]
-
-            f_ranked.write(json.dumps(ranked_entry) + "\n")
-
-            # -------------------------------------------------------------
-            # 3) Additional base/plus files with filtered all_solutions
-            # -------------------------------------------------------------
-            # Base file
-            base_entry = {k: v for k, v in ranked_entry.items() if k != "all_solutions"}
-            base_solutions = []
-            for sol_dict in ranked_entry["all_solutions"]:
-                b_rank = sol_dict["rank"]["base_execution"]
-                if b_rank is not None:
-                    new_sol = {
-                        "rank": b_rank,
-                        "average_test_score": round(sol_dict["average_test_score"]["base_execution"], 2),
-                        "average_time_taken": sol_dict["average_time_taken"]["base_execution"],
-                        "solution": sol_dict["solution"]
-                    }
-                    base_solutions.append(new_sol)
-
-            base_solutions = sorted(base_solutions, key=lambda x: x["rank"])
-            base_entry["all_solutions"] = base_solutions
-            f_base.write(json.dumps(base_entry) + "\n")
-
-            # Plus file
-            plus_entry = {k: v for k, v in ranked_entry.items() if k != "all_solutions"}
-            plus_solutions = []
-            for sol_dict in ranked_entry["all_solutions"]:
-                p_rank = sol_dict["rank"]["plus_execution"]
-                if p_rank is not None:
-                    new_sol = {
-                        "rank": p_rank,
-                        "average_test_score": round(sol_dict["average_test_score"]["plus_execution"], 2),
-                        "average_time_taken": sol_dict["average_time_taken"]["plus_execution"],
-                        "solution": sol_dict["solution"]
-                    }
-                    plus_solutions.append(new_sol)
-
-            plus_solutions = sorted(plus_solutions, key=lambda x: x["rank"])
-            plus_entry["all_solutions"] = plus_solutions
-            f_plus.write(json.dumps(plus_entry) + "\n")
+            for (f, buf), line in zip(outputs, lines):
+                buf += line
+                if len(buf) > WRITE_BUFFER_SIZE:
+                    f.write(buf)
+                    buf.clear()
+
+        for f, buf in outputs:
+            f.write(buf)
 
         print(f"Done! Tossed {tossed_solutions} solutions due to all non-empty stderrs.")
 
@@ -0,0 +1,190 @@
+# SPDX-License-Identifier: MIT
+
+# Per-line scoring, ranking and cleaning used by combine_solutions.py.
+# Kept free of I/O and fully annotated so it can be compiled with mypyc.
+
+from __future__ import annotations
+
+from itertools import chain
+from typing import Any
+
+import numpy as np
+
+TIME_RATIO_THRESHOLD = 1.0
+ASSERTION_ERROR_STDERR = "AssertionError()"
+
+# Execution result keys, built once instead of per call.
+BASE_KEY = "base_execution_result"
+PLUS_KEY = "plus_execution_result"
+SCORE_KEY = "average_test_score"
+TIME_KEY = "average_time_taken"
+
+def get_test_score(sol: dict[str, Any], exec_key: str) -> float:
+    """
+    Retrieve test_score from sol[exec_key]["average_test_score"], exec_key being BASE_KEY or PLUS_KEY.
+    Returns 0.0 if missing or invalid.
+    """
+    if not sol:
+        return 0.0
+    res = sol.get(exec_key, {})
+    return float(res[SCORE_KEY])
+
+def ensure_avg_time(res: dict[str, Any]) -> None:
+    """
+    Fill res["average_time_taken"] from the mean of res["time_taken"] if missing,
+    or float('inf') if there are no times (so that it is considered 'worst').
+    """
+    if TIME_KEY not in res:
+        times = res.get("time_taken", [])
+        if times:
+            res[TIME_KEY] = sum(times) / len(times)
+        else:
+            res[TIME_KEY] = float('inf')
+
+def get_time_taken(sol: dict[str, Any], exec_key: str) -> float:
+    """
+    Retrieve time_taken from sol[exec_key]["average_time_taken"], exec_key being BASE_KEY or PLUS_KEY.
+    Expects ensure_avg_time() to have run on the result; returns float('inf') if it is missing.
+    """
+    if not sol:
+        return float('inf')
+    res = sol.get(exec_key, {})
+    return float(res.get(TIME_KEY, float('inf')))
+
+def weighted_plus_score(sol: dict[str, Any], plus_score: float, base_score: float) -> float:
+    """
+    Combine the plus and base test scores, weighted by the number of plus and base inputs.
+    """
+    n_plus = len(sol.get("plus_input", []))
+    n_base = len(sol["base_input"])
+    return (plus_score * n_plus + base_score * n_base) / (n_plus + n_base)
+
+def score_table(solutions: list[dict[str, Any]], dims: list[str]) -> dict[tuple[int, str], tuple[float, float, float]]:
+    """
+    Precompute scores and times once for every solution and dimension.
+    The group score is the test_score itself for 'base' and the weighted_plus_score for 'plus'.
+    Returns: dict of (solution_id, dim) -> (group_score, test_score, time_taken).
+    """
+    table: dict[tuple[int, str], tuple[float, float, float]] = {}
+    for s in solutions:
+        add_scores(table, s, dims)
+    return table
+
+def add_scores(table: dict[tuple[int, str], tuple[float, float, float]], s: dict[str, Any], dims: list[str]) -> None:
+    """
+    Add the score_table() entries of a single solution to table, for callers that build it incrementally.
+    Fills in average_time_taken on the solution's execution results where missing.
+    """
+    sid = s["id"]
+    sol = s["solution"]
+    for exec_key in (BASE_KEY, PLUS_KEY):
+        if exec_key in sol:
+            ensure_avg_time(sol[exec_key])
+    base_score = get_test_score(sol, BASE_KEY)
+    table[sid, "base"] = (base_score, base_score, get_time_taken(sol, BASE_KEY))
+    if "plus" in dims:
+        plus_score = get_test_score(sol, PLUS_KEY)
+        table[sid, "plus"] = (weighted_plus_score(sol, plus_score, base_score), plus_score, get_time_taken(sol, PLUS_KEY))
+
+def rank_dimension(
+    solutions: list[dict[str, Any]],
+    dim: str,
+    original_id: int,
+    scores: dict[tuple[int, str], tuple[float, float, float]] | None = None,
+) -> dict[int, int]:
+    """
+    Rank solutions by `test_score` (descending) for the given dimension ('base' or 'plus'),
+    with tie-breaking via time ratio: within a group of equal scores, a solution whose time is
+    within TIME_RATIO_THRESHOLD of a faster survivor is discarded.
+
+    The solution with id == original_id is forced rank=1 and never discarded.
+    `scores` is an optional score_table() shared across dimensions.
+    Returns: dict of solution_id -> rank (int),
+             solutions not in the final ranking are omitted.
+    """
+    if scores is None:
+        scores = score_table(solutions, ["base", dim])
+
+    # Separate out the forced original solution
+    forced_original: dict[str, Any] | None = None
+    others: list[dict[str, Any]] = []
+    for s in solutions:
+        if s["id"] == original_id:
+            forced_original = s
+        else:
+            others.append(s)
+
+    # --- 1) Index 'others' by the first appearance of their group score for this dimension ---
+    n = len(others)
+    entries = [scores[s["id"], dim] for s in others]
+    group_first_seen: dict[float, int] = {}
+    group_index = np.fromiter((group_first_seen.setdefault(e[0], len(group_first_seen)) for e in entries),
+                              dtype=np.int64, count=n)
+    test_scores = np.fromiter((e[1] for e in entries), dtype=np.float64, count=n)
+
+    # --- 2) Tie-break solutions with equal scores by time ---
+    # max(t1, t2) / min(t1, t2) is never below 1.0, so at a threshold <= 1.0 nothing can be discarded.
+    discarded: set[int] = set()
+    if TIME_RATIO_THRESHOLD > 1.0:
+        tie_members = others if forced_original is None else others + [forced_original]
+        tie = np.array([scores[s["id"], dim] for s in tie_members], dtype=np.float64).reshape(-1, 3)
+        # Walk each tie group from fastest to slowest, comparing against the slowest survivor so far.
+        tie_key = None
+        kept_time = None
+        for k in np.lexsort((tie[:, 2], tie[:, 1], tie[:, 0])).tolist():
+            group_score, score, t = tie[k]
+            if (group_score, score) != tie_key:
+                tie_key = (group_score, score)
+                kept_time = None
+            if tie_members[k] is forced_original or kept_time is None or not t < TIME_RATIO_THRESHOLD * kept_time:
+                kept_time = t
+            else:
+                discarded.add(k)
+
+    # --- 3) Order survivors by test_score (descending), then group and input order ---
+    order = np.lexsort((group_index, -test_scores)).tolist()
+
+    # --- 4) Build the final ranking ---
+    result: dict[int, int] = {}
+    result[original_id] = 1
+    rank_counter = 2
+    for k in order:
+        if k not in discarded:
+            result[others[k]["id"]] = rank_counter
+            rank_counter += 1
+
+    return result
+
+def clean_solution_body(body: dict[str, Any]) -> dict[str, Any]:
+    """
+    Remove time_taken, unit_test_stderrs, unit_test_stdouts, correct_tests and traceback
+    from body's base/plus execution results, filling average_time_taken if missing.
+    Modifies 'body' in place and returns it.
+    """
+    for exec_key in (BASE_KEY, PLUS_KEY):
+        if exec_key in body:
+            res = body[exec_key]
+            ensure_avg_time(res)
+            for k in ["time_taken", "unit_test_stderrs", "unit_test_stdouts", "correct_tests", "traceback"]:
+                res.pop(k, None)
+    return body
+
+def all_stderrs_nonempty(sol: dict[str, Any]) -> bool:
+    """
+    Returns True if **all** stderr lines in base_execution_result['unit_test_stderrs']
+    + plus_execution_result['unit_test_stderrs'] are non-empty strings.
+    Otherwise returns False.
+    """
+    base_stderrs = sol["solution"][BASE_KEY]["unit_test_stderrs"]
+    if PLUS_KEY in sol["solution"]:
+        plus_stderrs = sol["solution"][PLUS_KEY]["unit_test_stderrs"]
+    else:
+        plus_stderrs = []
+
+    empty = True
+    for line in chain(base_stderrs, plus_stderrs):
+        empty = False
+        stripped = line.strip()
+        if not stripped or stripped == ASSERTION_ERROR_STDERR:
+            return False
+    return not empty
@@ -4,57 +4,75 @@ import json
 import argparse
 import math
 import os
-from statistics import mean
-from scipy.stats import kendalltau, spearmanr, rankdata
+from scipy.stats import kendalltau, rankdata
 import numpy as np
 
+from utils.jsonl import iter_mmap_lines, loads
+
 def compute_r2(y_true, y_pred):
     """
     Compute the coefficient of determination (R²).
     """
-    y_true = np.array(y_true)
-    y_pred = np.array(y_pred)
-    ss_res = np.sum((y_true - y_pred) ** 2)
-    ss_tot = np.sum((y_true - np.mean(y_true)) ** 2)
+    y_true = np.asarray(y_true, dtype=np.float64)
+    y_pred = np.asarray(y_pred, dtype=np.float64)
+    # Sums of squares as dot products, without materializing the squared arrays.
+    residuals = y_true - y_pred
+    ss_res = float(residuals @ residuals)
+    deviations = y_true - y_true.mean()
+    ss_tot = float(deviations @ deviations)
     return 1 - ss_res / ss_tot if ss_tot != 0 else 1.0
 
+def tie_free_rank_correlations(x_ranks, y_ranks):
+    """
+    Compute Kendall's Tau and Spearman's rho for two rankings of n > 1 items without ties.
+    Returns: (tau, spearman).
+    """
+    n = len(x_ranks)
+    x_signs = np.sign(np.subtract.outer(x_ranks, x_ranks))
+    y_signs = np.sign(np.subtract.outer(y_ranks, y_ranks))
+    tau = float((x_signs * y_signs).sum()) / (n * (n - 1))
+    d = np.asarray(x_ranks, dtype=np.float64) - np.asarray(y_ranks, dtype=np.float64)
+    spearman = 1 - 6 * float(d @ d) / (n * (n * n - 1))
+    return tau, spearman
+
 def process_file(filename, method):
     # Initialize dictionary for the four datasets.
     datasets = {"HE_plus": {}, "HE_base": {}, "MBPP_plus": {}, "MBPP_base": {}}
 
-    # Read and group entries from the JSONL file.
-    with open(filename, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                entry = json.loads(line)
-            except json.JSONDecodeError as e:
-                print(f"Skipping invalid JSON: {e}")
-                continue
-
-            ds = entry.get("dataset")
-            if ds not in datasets:
-                continue  # ignore datasets not in the allowed set
-            task_id = entry.get("task_id")
-            if task_id is None:
-                continue
-            datasets[ds].setdefault(task_id, []).append(entry)
-
-    # Verification: in each group, ensure all entries share the same dataset and task_id.
-    for ds, groups in datasets.items():
-        for tid, entries in groups.items():
-            for entry in entries:
-                if entry.get("dataset") != ds or entry.get("task_id") != tid:
-                    raise ValueError(f"Verification failed in dataset {ds} for task_id {tid}")
+    # Read and group entries from the memory-mapped JSONL file.
+    for line in iter_mmap_lines(filename):
+        # orjson tolerates surrounding whitespace, so only blank lines need skipping.
+        if not line or line.isspace():
+            continue
+        try:
+            entry = loads(line)
+        except json.JSONDecodeError as e:
+            print(f"Skipping invalid JSON: {e}")
+            continue
+
+        ds = entry.get("dataset")
+        if ds not in datasets:
+            continue  # ignore datasets not in the allowed set
+        task_id = entry.get("task_id")
+        if task_id is None:
+            continue
+        datasets[ds].setdefault(task_id, []).append(entry)
+
+    # The chosen score is the same for every group, so its accessor is picked once.
+    if method == "reward":
+        get_score = lambda e: e["reward"]["reward_score"]
+    else:
+        get_score = lambda e: e["average_test_score"]
+    # Reward scores are unbounded and are min-max normalized per group; test scores are used as-is.
+    normalize_scores = method == "reward"
 
     # Prepare to accumulate metrics per dataset.
     results = {}
     for ds, groups in datasets.items():
-        total_mae =  []
-        total_ground_scores = []
-        total_noramalized_reward_scores = []
+        # Per-group score arrays, concatenated once all groups are processed.
+        mae_chunks = []
+        ground_score_chunks = []
+        normalized_reward_chunks = []
         group_kendall = []
         group_spearman = []
         top1_correct = 0
@@ -65,105 +83,93 @@ def process_file(filename, method):
         for tid, entries in groups.items():
             num_groups += 1
 
-            # Sort entries in the group by the chosen score (no random tie-breaker).
+            # Extract the chosen score once per group.
+            n = len(entries)
             try:
-                if method == "reward":
-                    sorted_entries = sorted(entries, key=lambda x: x["reward"]["reward_score"], reverse=True)
-                else:
-                    sorted_entries = sorted(entries, key=lambda x: x["average_test_score"], reverse=True)
+                raw_scores = np.fromiter(map(get_score, entries), dtype=np.float64, count=n)
             except KeyError as e:
                 raise KeyError(f"Missing key {e} in one of the entries in task_id {tid}")
 
-            # Extract scores for computed ranking.
-            if method == "reward":
-                scores = [entry["reward"]["reward_score"] for entry in sorted_entries]
-            else:
-                scores = [entry["average_test_score"] for entry in sorted_entries]
+            # Sort entries in the group by the chosen score (no random tie-breaker).
+            order = np.argsort(-raw_scores, kind='stable')
+            scores = raw_scores[order]
+            sorted_entries = [entries[i] for i in order.tolist()]
 
             # Compute computed ranks using average ranking.
             # (Negate scores so that higher scores get lower rank numbers.)
-            computed_ranks_array = rankdata([-s for s in scores], method='average')
+            computed_ranks_array = rankdata(-scores, method='average')
             for i, entry in enumerate(sorted_entries):
                 entry["computed_rank"] = computed_ranks_array[i]
 
             # Process the given ranks with average ranking in case of ties.
-            raw_given_ranks = [entry["rank"] for entry in sorted_entries]
+            raw_given_ranks = np.fromiter((entry["rank"] for entry in sorted_entries), dtype=np.float64, count=n)
             given_ranks_avg = rankdata(raw_given_ranks, method='average')
 
             # Compute Kendall's Tau and Spearman's rho on the averaged ranks.
-            tau, _ = kendalltau(given_ranks_avg, computed_ranks_array)
+            # Without ties both have a closed form; scipy is only needed to correct for ties.
+            if n < 2:
+                # Both are undefined for a single entry.
+                tau, spearman = 0.0, 0.0
+            elif np.unique(raw_given_ranks).size == n and np.unique(scores).size == n:
+                tau, spearman = tie_free_rank_correlations(given_ranks_avg, computed_ranks_array)
+            else:
+                tau, _ = kendalltau(given_ranks_avg, computed_ranks_array)
+                # On averaged ranks, Spearman's rho is their Pearson correlation (nan if either is constant).
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    spearman = np.corrcoef(given_ranks_avg, computed_ranks_array)[0, 1]
+
             if tau is None or np.isnan(tau):
                 tau = 0.0
             group_kendall.append(tau)
 
-
-            spearman, _ = spearmanr(given_ranks_avg, computed_ranks_array)
-            if spearman is None or np.isnan(spearman):
+            if np.isnan(spearman):
                 spearman = 0.0
             group_spearman.append(spearman)
 
             # Top-1 accuracy: use fractional ranking for the top group.
             # Identify all entries tied at the top (by computed score).
-            if method == "reward":
-                top_score = sorted_entries[0]["reward"]["reward_score"]
-                score_func = lambda e: e["reward"]["reward_score"]
-            else:
-                top_score = sorted_entries[0]["average_test_score"]
-                score_func = lambda e: e["average_test_score"]
-
-            top_group = [entry for entry in sorted_entries if score_func(entry) == top_score]
-            count_top = len(top_group)
+            top_group = scores == scores[0]
+            count_top = int(top_group.sum())
             # If the unique ground truth top (rank==1) is among the tie, add fractional credit.
-            if any(entry["rank"] == 1 for entry in top_group):
+            if (raw_given_ranks[top_group] == 1).any():
                 top1_correct += 1 / count_top
 
             # Identify the computed bottom group: all entries with the lowest computed score.
-            if method == "reward":
-                bottom_score = sorted_entries[-1]["reward"]["reward_score"]
-                score_func = lambda e: e["reward"]["reward_score"]
-            else:
-                bottom_score = sorted_entries[-1]["average_test_score"]
-                score_func = lambda e: e["average_test_score"]
-
-            bottom_group = [entry for entry in sorted_entries if score_func(entry) == bottom_score]
-            count_bottom = len(bottom_group)
+            bottom_group = scores == scores[-1]
+            count_bottom = int(bottom_group.sum())
 
             # The ground truth always has a unique bottom (with the maximum rank).
-            ground_truth_bottom = max(entry["rank"] for entry in sorted_entries)
-            if any(entry["rank"] == ground_truth_bottom for entry in bottom_group):
+            ground_truth_bottom = raw_given_ranks.max()
+            if (raw_given_ranks[bottom_group] == ground_truth_bottom).any():
                 bottom1_correct += 1 / count_bottom
 
 
             # For MAE and R² computations.
-            if method == "reward":
-                high = sorted_entries[0]["reward"]["reward_score"]
-                low = sorted_entries[-1]["reward"]["reward_score"]
+            if normalize_scores:
+                high = scores[0]
+                low = scores[-1]
                 denom = high - low if high != low else 1.0  # Avoid division by zero.
-                normalized_reward_scores = [
-                    (entry["reward"]["reward_score"] - low) / denom for entry in sorted_entries
-                ]
+                normalized_reward_scores = (scores - low) / denom
             else:
-                high = 1.0
-                low = 0.0
-                denom = 1.0  # Avoid division by zero.
-                normalized_reward_scores = [
-                    entry["average_test_score"] for entry in sorted_entries
-                ]
+                normalized_reward_scores = scores
 
-            ground_scores = [entry["ground_average_test_score"] for entry in sorted_entries]
+            ground_scores = np.array([entry["ground_average_test_score"] for entry in sorted_entries], dtype=np.float64)
 
             # Compute MAE and R² between normalized rewards and ground scores.
-            deltas = [abs(nr - gs) for nr, gs in zip(normalized_reward_scores, ground_scores)]
-            total_mae += deltas
-            total_ground_scores += ground_scores
-            total_noramalized_reward_scores += normalized_reward_scores
+            mae_chunks.append(np.abs(normalized_reward_scores - ground_scores))
+            ground_score_chunks.append(ground_scores)
+            normalized_reward_chunks.append(normalized_reward_scores)
+
+        total_mae = np.concatenate(mae_chunks) if mae_chunks else np.empty(0)
+        total_ground_scores = np.concatenate(ground_score_chunks) if ground_score_chunks else np.empty(0)
+        total_noramalized_reward_scores = np.concatenate(normalized_reward_chunks) if normalized_reward_chunks else np.empty(0)
 
         # Aggregate metrics for the dataset.
         results[ds] = {
-            "total_MAE": mean(total_mae) if total_mae else None,
-            "total_R2": compute_r2(total_ground_scores, total_noramalized_reward_scores) if total_ground_scores else None,
-            "mean_Kendall_tau": mean(group_kendall) if group_kendall else None,
-            "mean_spearman": mean(group_spearman) if group_spearman else None,
+            "total_MAE": float(total_mae.mean()) if total_mae.size else None,
+            "total_R2": compute_r2(total_ground_scores, total_noramalized_reward_scores) if total_ground_scores.size else None,
+            "mean_Kendall_tau": float(np.mean(group_kendall)) if group_kendall else None,
+            "mean_spearman": float(np.mean(group_spearman)) if group_spearman else None,
             "top1_accuracy": top1_correct / num_groups if num_groups else None,
             "bottom1_accuracy": bottom1_correct / num_groups if num_groups else None,
             "topn_accuracy": topn_correct / num_groups if num_groups else None,
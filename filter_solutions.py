@@ -2,7 +2,14 @@
 
 import argparse
 import json
-from collections import defaultdict
+from heapq import merge
+
+import numpy as np
+
+from utils.jsonl import iter_mmap_lines
+
+# Number of encoded records collected before each write of the filtered output.
+WRITE_BATCH_SIZE = 1000
 
 def pick_spaced_solutions(sorted_solutions, k):
     """
@@ -22,17 +29,16 @@ def pick_spaced_solutions(sorted_solutions, k):
         return sorted_solutions
 
     max_score = 1.0
+    scores = np.fromiter((s["average_test_score"] for s in sorted_solutions), dtype=np.float64, count=n)
+    # Scores are descending, so their negation is ascending and can be binary searched.
+    neg_scores = -scores
     selected_indices = set()
 
     # Look for a candidate solution with a low positive score (between 0.0 and 0.1).
-    # Since sorted_solutions is in descending order, we iterate in reverse (i.e. ascending by score)
-    # so that the first candidate we find is the one with the smallest score among those > 0.0.
-    candidate_idx = None
-    for i in reversed(range(n)):
-        score = sorted_solutions[i]["average_test_score"]
-        if 0.0 < score < 0.1:
-            candidate_idx = i
-            break
+    # Since sorted_solutions is in descending order, the last candidate
+    # is the one with the smallest score among those > 0.0.
+    low_positive = np.flatnonzero((scores > 0.0) & (scores < 0.1))
+    candidate_idx = int(low_positive[-1]) if low_positive.size else None
 
     if candidate_idx is not None:
         min_score = sorted_solutions[candidate_idx]["average_test_score"]
@@ -41,23 +47,42 @@ def pick_spaced_solutions(sorted_solutions, k):
         min_score = sorted_solutions[-1]["average_test_score"]
         selected_indices.add(n - 1)
 
+    available = np.ones(n, dtype=bool)
+    available[list(selected_indices)] = False
+
     # Generate target quantiles; the extremes (1.0 and our chosen min_score) are already included.
     targets = [max_score - t * (max_score - min_score)
                for t in [i / (k) for i in range(1, k)]]
 
-    # For each target, find the available solution closest to the target score.
+    # For each target, find the available solution closest to the target score,
+    # preferring the lowest index on equal distance.
     for target in targets:
         best_idx = None
         best_diff = float("inf")
-        for i, sol in enumerate(sorted_solutions):
-            if i in selected_indices:
-                continue
-            diff = abs(sol["average_test_score"] - target)
-            if diff < best_diff:
-                best_diff = diff
+        # Indices before split score above the target, the rest at or below it.
+        split = int(np.searchsorted(neg_scores, -target, side="left"))
+
+        # Closest at or below the target: the first available index from split on.
+        below = np.flatnonzero(available[split:])
+        if below.size:
+            best_idx = split + int(below[0])
+            best_diff = abs(scores[best_idx] - target)
+
+        # Closest above the target: the last available index before split,
+        # moved back to the first available index with the same score.
+        above = np.flatnonzero(available[:split])
+        if above.size:
+            i = int(above[-1])
+            run_start = int(np.searchsorted(neg_scores, neg_scores[i], side="left"))
+            i = run_start + int(np.flatnonzero(available[run_start:i + 1])[0])
+            diff = abs(scores[i] - target)
+            if diff <= best_diff:
                 best_idx = i
+                best_diff = diff
+
         if best_idx is not None:
             selected_indices.add(best_idx)
+            available[best_idx] = False
 
     # Return the selected solutions in the order of their original indices.
     return [sorted_solutions[i] for i in sorted(selected_indices)]
@@ -75,23 +100,23 @@ def process_solutions(solutions):
        but always include any rank-1 solutions even if that makes more than 5.
     3. Finally, reassign the rank numbers based on descending average_test_score (so rank 1 has score 1.0).
     """
-    # Group all solutions by average_test_score.
-    groups = defaultdict(list)
-    for s in solutions:
-        score = s["average_test_score"]
-        groups[score].append(s)
-    
+    # Sort so that equal scores form runs with rank-1 solutions first, then by average_time_taken.
+    # The first solution of each run is then either rank 1 or the fastest non-rank1 solution.
+    items = sorted(solutions, key=lambda s: (s["average_test_score"], s.get("rank") != 1, s["average_time_taken"]))
+
     deduped = []
-    for score, group in groups.items():
-        # Check if any solution in this score group is rank 1.
-        rank1_group = [s for s in group if s.get("rank") == 1]
-        if rank1_group:
+    run_score = None
+    run_is_rank1 = False
+    for s in items:
+        is_rank1 = s.get("rank") == 1
+        if deduped and s["average_test_score"] == run_score:
             # Keep all rank-1 solutions and ignore the non-rank1 duplicates.
-            deduped.extend(rank1_group)
-        else:
-            # Otherwise, keep only the non-rank1 solution with the smallest average_time_taken.
-            best = min(group, key=lambda s: s["average_time_taken"])
-            deduped.append(best)
+            if run_is_rank1 and is_rank1:
+                deduped.append(s)
+            continue
+        run_score = s["average_test_score"]
+        run_is_rank1 = is_rank1
+        deduped.append(s)
     
     # Separate deduped solutions into rank1 and non-rank1.
     rank1_solutions = [s for s in deduped if s.get("rank") == 1]
@@ -107,25 +132,27 @@ def process_solutions(solutions):
     # Always keep rank1 solutions. Then, if the total is less than 5, pick additional non-rank1
     # solutions (spread evenly across the score range) to bring the total up to 5.
     if len(rank1_sorted) >= 5:
-        final_solutions = rank1_sorted
+        spaced_non_rank1 = []
     else:
         need_more = 5 - len(rank1_sorted)
         # Only pick as many as are available.
         spaced_non_rank1 = pick_spaced_solutions(non_rank1_sorted, min(need_more, len(non_rank1_sorted)))
-        final_solutions = rank1_sorted + spaced_non_rank1
 
     # Re-rank the final solutions by descending average_test_score.
-    final_solutions_sorted = sorted(final_solutions, key=lambda s: s["average_test_score"], reverse=True)
+    # Both parts are already in that order, so they only need merging.
+    final_solutions_sorted = list(merge(rank1_sorted, spaced_non_rank1, key=lambda s: -s["average_test_score"]))
     for i, sol in enumerate(final_solutions_sorted, start=1):
         sol["rank"] = i
 
     return final_solutions_sorted
 
 def filter_jsonl(input_path, output_path):
-    with open(input_path, "r", encoding="utf-8") as fin, \
-         open(output_path, "w", encoding="utf-8") as fout:
+    with open(output_path, "wb") as fout:
         
-        for line in fin:
+        batch = []
+        for line in iter_mmap_lines(input_path):
+            # json keeps the Infinity time sentinels and test inputs wider than 64 bits exact,
+            # both of which orjson would corrupt.
             record = json.loads(line)
             solutions = record.get("all_solutions", [])
 
@@ -148,7 +175,11 @@ def filter_jsonl(input_path, output_path):
             updated[0]["solution"]["canonical_solution"] = updated[0]["solution"]["prompt"] + updated[0]["solution"]["canonical_solution"]
             record["all_solutions"] = updated
             
-            fout.write(json.dumps(record, ensure_ascii=False) + "\n")
+            batch.append((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            if len(batch) >= WRITE_BATCH_SIZE:
+                fout.writelines(batch)
+                batch.clear()
+        fout.writelines(batch)
 
 if __name__ == "__main__":
 
@@ -2,6 +2,10 @@
 
 import json
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 from openai import OpenAI
 from utils.unit_test_executor import process_data
 
@@ -28,8 +32,17 @@ Question:
 Answer:
 """
 
+# The first fenced code block in a response, without its optional python language tag.
+CODE_BLOCK_PATTERN = re.compile(r"```\s*(?:python)?([\s\S]*?)```")
+
+# Number of encoded lines collected before each write of the rewritten execution results.
+WRITE_BATCH_SIZE = 1000
+
+# Dataset and execution records are read and written with json rather than orjson: their test
+# inputs can hold integers wider than 64 bits, which orjson turns into floats or rejects.
+
 def load_input_file(input_file):
-    with open(input_file, 'r') as f:
+    with open(input_file, 'rb') as f:
         return [json.loads(line) for line in f]
 
 def initialize_openai_client(api_key):
@@ -38,74 +51,68 @@ def initialize_openai_client(api_key):
 def format_prompt(instruction, initial_prompt):
     return initial_prompt.format(instruction=instruction)
 
-def perform_inference(input_lines, client, initial_prompt, dataset_type, limit, seed, temperature):
-    outputs = []
-    for count, line in enumerate(input_lines):
-        if count % 1 == 0:
-            print("Processing prompt", count)
+def request_solution(client, formatted_input, seed):
+    response = client.chat.completions.create(
+        model="gpt-4o-2024-11-20",
+        messages=[{"role": "user", "content": formatted_input}],
+        max_tokens=1048,
+        temperature=1.0,
+        n=1,
+        top_p=1.0,
+        seed=seed
+    )
+    return extract_code_block(response.choices[0].message.content)
 
+def perform_inference(input_lines, client, initial_prompt, dataset_type, limit, seed, temperature):
+    formatted_inputs = []
+    for line in input_lines[:limit + 1]:
         instruction = line['text'] if dataset_type == "MBPP" else line['prompt']
-        formatted_input = format_prompt(instruction, initial_prompt)
-
-        response = client.chat.completions.create(
-            model="gpt-4o-2024-11-20",
-            messages=[{"role": "user", "content": formatted_input}],
-            max_tokens=1048,
-            temperature=1.0,
-            n=1,
-            top_p=1.0,
-            seed=seed
-        )
+        formatted_inputs.append(format_prompt(instruction, initial_prompt))
 
-        content = extract_code_block(response.choices[0].message.content)
-        outputs.append({"canonical_solution": content})
-
-        if count >= limit:
-            break
+    outputs = []
+    # The requests are I/O-bound, so they are issued concurrently; map keeps the input order.
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        for count, content in enumerate(executor.map(lambda x: request_solution(client, x, seed), formatted_inputs)):
+            print("Processing prompt", count)
+            outputs.append({"canonical_solution": content})
 
-    print(f"Completed processing {count + 1} prompts")
+    print(f"Completed processing {len(outputs)} prompts")
     return outputs
 
 def extract_code_block(content):
-    if '```' in content:
-        first_index = content.find('```')
-        second_index = content.find('```', first_index + 1)
-        content = content[first_index + 3:second_index].strip()
-
-        if content.startswith('python'):
-            content = content[len('python'):].strip()
+    match = CODE_BLOCK_PATTERN.search(content)
+    if match:
+        return match.group(1).strip()
     return content
 
 def merge_with_ground_truth(input_file, outputs, dataset_type, limit):
-    with open(input_file, 'r') as f:
-        lines = f.readlines()
+    """
+    Lazily yield the input lines, up to and including line `limit`, with the generated
+    solutions merged in, as JSON bytes without the trailing newline.
+    """
+    with open(input_file, 'rb') as f:
+        for i, line in enumerate(f):
+            data = json.loads(line)
 
-    updated_lines = []
-    for i, line in enumerate(lines):
-        data = json.loads(line.strip())
+            if dataset_type == "MBPP":
+                data['code'] = outputs[i]['canonical_solution']
+            else:
+                data['canonical_solution'] = outputs[i]['canonical_solution']
 
-        if dataset_type == "MBPP":
-            data['code'] = outputs[i]['canonical_solution']
-        else:
-            data['canonical_solution'] = outputs[i]['canonical_solution']
+            yield json.dumps(data).encode('utf-8')
 
-        updated_lines.append(json.dumps(data))
-
-        if i >= limit:
-            break
-
-    return updated_lines
+            if i >= limit:
+                break
 
 def write_output_file(output_file, updated_lines):
-    with open(output_file, 'w') as f:
-        for line in updated_lines:
-            f.write(line + '\n')
+    with open(output_file, 'wb') as f:
+        f.writelines(line + b'\n' for line in updated_lines)
 
 def execute_code(updated_lines, output_file_exec, dataset_type, timeout, timeouts_list=False):
 
     process_data(updated_lines, output_file_exec, dataset_type=dataset_type, add_prompt=False, timeout=timeout, timeouts_list=timeouts_list)
 
-    with open(output_file_exec, 'r') as f:
+    with open(output_file_exec, 'rb') as f:
         lines_predicted = f.readlines()
 
     if dataset_type == "MBPP":
@@ -114,46 +121,79 @@ def execute_code(updated_lines, output_file_exec, dataset_type, timeout, timeout
         rewrite_other_results(output_file_exec, lines_predicted, updated_lines)
 
 def rewrite_mbpp_results(output_file_exec, lines_predicted):
-    with open(output_file_exec, 'w') as f:
+    with open(output_file_exec, 'wb') as f:
+        batch = []
         for line in lines_predicted:
-            line = json.loads(line.strip())
+            line = json.loads(line)
             line['base_execution_result']['average_test_score'] = sum(line['base_execution_result']['correct_tests']) / len(line['base_execution_result']['correct_tests'])
             del line['plus_execution_result']
-            f.write(json.dumps(line) + '\n')
+            batch.append((json.dumps(line) + '\n').encode('utf-8'))
+            if len(batch) >= WRITE_BATCH_SIZE:
+                f.writelines(batch)
+                batch.clear()
+        f.writelines(batch)
 
 def rewrite_other_results(output_file_exec, lines_predicted, updated_lines):
-    with open(output_file_exec, 'w') as f:
+    with open(output_file_exec, 'wb') as f:
+        batch = []
         count = 0
         for line_predicted, line_expected in zip(lines_predicted, updated_lines):
-            data_predicted = json.loads(line_predicted.strip())
+            data_predicted = json.loads(line_predicted)
             data_expected = line_expected
             count += 1
 
 
             for type in ['base_execution_result', 'plus_execution_result']:
-                data_predicted[type]['correct_tests'] = []
-                for test_predicted, test_expected in zip(data_predicted[type]['unit_test_stdouts'], data_expected[type]['unit_test_stdouts']):
-                    test_predicted, test_expected = process_value(test_predicted), process_value(test_expected)
-
-                    if data_predicted['atol'] == 0:
-                        try:
-                            is_correct = test_predicted == test_expected
-                        except Exception:
-                            is_correct = False
-                    else:
-                        try:
-                            is_correct = abs(float(test_predicted) - float(test_expected)) <= data_predicted['atol']
-                        except Exception:
-                            is_correct = False
-
-                    data_predicted[type]['correct_tests'].append(is_correct)
+                data_predicted[type]['correct_tests'] = compare_outputs(
+                    data_predicted[type]['unit_test_stdouts'], data_expected[type]['unit_test_stdouts'], data_predicted['atol']
+                )
 
                 if len(data_predicted[type]['correct_tests']) != 0:
                     data_predicted[type]['average_test_score'] = sum(data_predicted[type]['correct_tests']) / len(data_predicted[type]['correct_tests'])
 
-            data_predicted['average_time_taken'] = sum(data_predicted['base_execution_result']['time_taken'] + data_predicted['plus_execution_result']['time_taken']) / len(data_predicted['base_execution_result']['time_taken'] + data_predicted['plus_execution_result']['time_taken'])
+            times = data_predicted['base_execution_result']['time_taken'] + data_predicted['plus_execution_result']['time_taken']
+            data_predicted['average_time_taken'] = sum(times) / len(times)
+
+            batch.append((json.dumps(data_predicted) + '\n').encode('utf-8'))
+            if len(batch) >= WRITE_BATCH_SIZE:
+                f.writelines(batch)
+                batch.clear()
+        f.writelines(batch)
+
+def compare_outputs(outputs_predicted, outputs_expected, atol):
+    """
+    Compare predicted and expected unit test stdouts pairwise.
+    With atol > 0 the outputs are compared as numbers within atol, in one vectorized pass
+    when every output parses as a float. Returns a list of bools, one per pair.
+    """
+    n = min(len(outputs_predicted), len(outputs_expected))
+    if atol != 0 and n:
+        try:
+            predicted = np.fromiter((float(v) for v in outputs_predicted[:n]), dtype=np.float64, count=n)
+            expected = np.fromiter((float(v) for v in outputs_expected[:n]), dtype=np.float64, count=n)
+        except ValueError:
+            pass
+        else:
+            with np.errstate(invalid='ignore'):
+                return (np.abs(predicted - expected) <= atol).tolist()
+
+    correct_tests = []
+    for test_predicted, test_expected in zip(outputs_predicted, outputs_expected):
+        test_predicted, test_expected = process_value(test_predicted), process_value(test_expected)
+
+        if atol == 0:
+            try:
+                is_correct = test_predicted == test_expected
+            except Exception:
+                is_correct = False
+        else:
+            try:
+                is_correct = abs(float(test_predicted) - float(test_expected)) <= atol
+            except Exception:
+                is_correct = False
 
-            f.write(json.dumps(data_predicted) + '\n')
+        correct_tests.append(is_correct)
+    return correct_tests
 
 def process_value(value):
     value = value.strip()
@@ -1,6 +1,7 @@
 # SPDX-License-Identifier: MIT
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 import json
 import os
@@ -43,28 +44,34 @@ def main():
     output_path = args.output_path
 
 
-    with open(input_path, "r", encoding="utf-8") as fin, \
-            open(output_path, "w", encoding="utf-8") as fout:
+    # The reward requests are I/O-bound, so each record's requests are issued concurrently.
+    with open(input_path, "rb") as fin, \
+            open(output_path, "wb") as fout, \
+            ThreadPoolExecutor(max_workers=16) as executor:
         
         for i, line in enumerate(fin):
+            # Records are read and written with json, which keeps Infinity/NaN values and test
+            # inputs wider than 64 bits exact; orjson would corrupt both.
             record = json.loads(line)
             solutions = record["all_solutions"]
+
+            prompts = [sol["solution"]["prompt"] for sol in solutions] + [record["instruction"]]
+            answers = [sol["solution"]["canonical_solution"] for sol in solutions] + [record["output"]]
+            responses = list(executor.map(reward_request, prompts, answers))
             
-            for sol in solutions:
-                response = reward_request(sol["solution"]["prompt"], sol["solution"]["canonical_solution"])
-                
+            for sol, response in zip(solutions, responses):
                 sol["reward"] = {
                     "reward_score": float(response.split(':')[1].strip()),
                     "response": response,
                 }
-            response = reward_request(record["instruction"], record["output"])
+            response = responses[-1]
 
             record["reward"] = {
                 "reward_score": response,
                 "reward_score":  float(response.split(':')[1].strip()),
             }
             
-            fout.write(json.dumps(record, ensure_ascii=False) + "\n")
+            fout.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
             print("Completed processing", i + 1, "lines")
 
 
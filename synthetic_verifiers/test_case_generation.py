@@ -1,13 +1,57 @@
 # SPDX-License-Identifier: MIT
 
 import argparse
+import asyncio
+import functools
+import hashlib
 import json
-from openai import OpenAI
+import httpx
+import orjson
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 import re
 import os
-from concurrent.futures import ThreadPoolExecutor
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
 
-instruction_only_format = '''
+# tiktoken is optional; without it, token counts are estimated from the prompt length.
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# uvloop is optional; it replaces the default asyncio event loop with a faster one where available.
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Connection pool size of the async client; in-flight requests are bounded by --max_concurrency.
+MAX_CONNECTIONS = 200
+
+# Attempts the client makes on rate limit (429), timeout, connection and server errors, with
+# exponential backoff that honours the provider's Retry-After header.
+MAX_RETRIES = 6
+
+# Rough characters per token, used to estimate token counts when tiktoken cannot encode for the model.
+CHARS_PER_TOKEN = 4
+
+# Upper bound on input lines scheduled but not yet written, which bounds memory on large inputs.
+MAX_PENDING_TASKS = 1000
+
+# Batch API polling: seconds between status checks and the statuses after which a batch no longer changes.
+BATCH_POLL_INTERVAL = 60
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Sampling temperature of the test case requests; above 0 responses are not reproducible.
+TEMPERATURE = 1.0
+ASSERTION_PATTERN = re.compile(r"<assertion>(.*?)</assertion>", re.DOTALL)
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "scoring_verifiers", "test_case_generation.jsonl")
+
+# The few-shot examples and guidelines are sent as an identical leading system message on every
+# request so the provider can reuse its prompt prefix cache; only the short user message varies.
+instruction_only_system_prompt = '''
 You are an expert at writing assertion test cases and below is a question with function signature and test cases. 
 You must generate 10 assert test cases that will be used to evaluate the code solution's correctness. You must adhere to the provided function signature and test case format.
 Here are some examples that you should use as a reference:
@@ -106,15 +150,14 @@ Here are guidelines for writing the assertion test cases:
 6. Remember, it is your responsibility to carefully read the question and generate test cases that will evaluate the correctness of the solution.
 
 Here is the question you must provide assertion test cases for:
+'''
 
-
-
-Question: {input}
+instruction_only_user_format = '''Question: {input}
 Test Cases:
 '''
 
 
-instruction_solution_format = '''
+instruction_solution_system_prompt = '''
 You are an expert at writing assertion test cases and below is a question with function signature and completed code solution. 
 You must generate 10 assert statements that will be used to evaluate the code solution's correctness which may or may not be correct.
 Here are some examples that you should use as a reference:
@@ -236,91 +279,394 @@ Here are guidelines for writing the assertion test cases:
 6. Remember, it is your responsibility to carefully read the question and generate test cases that will evaluate the correctness of the solution.
 
 Here is the question and code solution you must provide assertion test cases for:
+'''
 
-
-
-Question: {input}
+instruction_solution_user_format = '''Question: {input}
 Solution:
 {code}
 Test Cases:
 '''
 
-def load_input_file(input_file):
-    with open(input_file, 'r') as f:
-        return [json.loads(line) for line in f]
+# The user message templates are split around their placeholders once, so that building a request is
+# plain string concatenation instead of parsing the format string every time.
+instruction_only_user_prefix, instruction_only_user_suffix = instruction_only_user_format.split("{input}")
+instruction_solution_user_prefix, instruction_solution_user_middle, instruction_solution_user_suffix = re.split(
+    r"\{input\}|\{code\}", instruction_solution_user_format)
+
+# Input lines are read and written with json rather than orjson: benchmark records can carry test
+# inputs wider than 64 bits and non-finite floats, which orjson cannot round-trip.
+def iter_input_file(input_file):
+    with open(input_file, 'rb') as f:
+        for line in f:
+            yield json.loads(line)
+
+def encode_line(line):
+    return (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
 
 def initialize_openai_client(api_key):
-    return OpenAI(api_key=api_key)
+    limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+    return AsyncOpenAI(api_key=api_key, http_client=DefaultAsyncHttpxClient(limits=limits), max_retries=MAX_RETRIES)
+
+class RateLimiter:
+    """
+    Token bucket holding up to per_minute units, refilled continuously at per_minute units per minute.
+    Waiters are served in arrival order.
+    """
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.available = per_minute
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        # A request larger than the whole bucket would otherwise wait forever.
+        amount = min(amount, self.per_minute)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.available = min(self.per_minute, self.available + (now - self.updated) * self.per_minute / 60)
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) * 60 / self.per_minute)
+
+@functools.lru_cache(maxsize=None)
+def get_encoder(model):
+    """
+    Return the tiktoken encoding for model, loaded once per model.
+    Returns None if tiktoken is not installed or does not know the model.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return None
+
+def count_tokens(text, model):
+    encoder = get_encoder(model)
+    if encoder is None:
+        return len(text) // CHARS_PER_TOKEN
+    return len(encoder.encode(text, disallowed_special=()))
+
+@functools.lru_cache(maxsize=None)
+def count_system_prompt_tokens(system_prompt, model):
+    # The system prompts are the same few strings on every request, so they are only encoded once.
+    return count_tokens(system_prompt, model)
+
+def count_prompt_tokens(request):
+    """
+    Count the tokens of a request's messages, excluding the per-message overhead of the chat format.
+    """
+    system_message, *messages = request["messages"]
+    model = request["model"]
+    return count_system_prompt_tokens(system_message["content"], model) + sum(
+        count_tokens(message["content"], model) for message in messages)
+
+def exceeds_context(request, prompt_tokens, max_context_tokens):
+    """
+    Returns True if the prompt and the completion tokens the request asks for do not fit in max_context_tokens.
+    """
+    return max_context_tokens is not None and prompt_tokens + request["max_completion_tokens"] > max_context_tokens
+
+def cache_key(model, prompt_format, messages, n=1):
+    # n is only part of the key when sampling several responses, which keeps single-sample keys unchanged.
+    fields = {"m": model, "f": prompt_format, "p": messages}
+    if n != 1:
+        fields["n"] = n
+    payload = json.dumps(fields, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_cache(cache_file):
+    """
+    Load the response cache, a JSONL file of {"key", "content"} records, into a dict.
+    Lines left incomplete by an interrupted run are skipped.
+    """
+    cache = {}
+    if os.path.exists(cache_file):
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                cache[record["key"]] = record["content"]
+    return cache
 
 def extract_code_block(content):
-    if "</think>" in content:
-        content = content.split("</think>")[-1]
-    pattern = r"<assertion>(.*?)</assertion>"
-    matches = re.findall(pattern, content, re.DOTALL)
-    return matches
-
-def process_prompt(args):
-    idx, line, client, prompt_format, model = args
-    print("Processing prompt", idx)
-    
+    # Only the text after the last </think> tag is the answer; this is the whole content if there is none.
+    content = content.rpartition("</think>")[2]
+    return ASSERTION_PATTERN.findall(content)
+
+def attach_responses(line, response_contents):
+    """
+    Store the response contents and the assertions extracted from them on line.
+    A single response keeps the flat format; several are stored as per-sample lists.
+    """
+    if len(response_contents) == 1:
+        line['unit_test_responses'] = response_contents[0]
+        line['unit_tests'] = extract_code_block(response_contents[0])
+    else:
+        line['unit_test_responses'] = response_contents
+        line['unit_tests'] = [extract_code_block(content) for content in response_contents]
+
+def prompt_digest(line, prompt_format):
+    """
+    Digest of the input fields that make up the prompt of line, identical for identical prompts.
+    """
+    fields = [line['instruction'], line['output'] if prompt_format == "instruction_solution" else None]
+    return hashlib.sha256(orjson.dumps(fields)).digest()
+
+def build_request(line, prompt_format, model, samples_per_question=1):
+    """
+    Build the chat completion request parameters for one input line.
+    All samples_per_question responses come from the one request, so the prompt is only processed once.
+    """
     if prompt_format == "instruction_only":
-        formatted_input = instruction_only_format.format(input=line['instruction'])
+        system_prompt = instruction_only_system_prompt
+        formatted_input = instruction_only_user_prefix + line['instruction'] + instruction_only_user_suffix
     elif prompt_format == "instruction_solution":
-        formatted_input = instruction_solution_format.format(input=line['instruction'], code=line['output'])
+        system_prompt = instruction_solution_system_prompt
+        formatted_input = (instruction_solution_user_prefix + line['instruction'] + instruction_solution_user_middle
+                           + line['output'] + instruction_solution_user_suffix)
     else:
         raise ValueError("Invalid prompt format")
+    return {
+        "model": model,
+        "messages": [{"role": "system", "content": system_prompt}, {"role": "user", "content": formatted_input}],
+        "max_completion_tokens": 16000,
+        "temperature": TEMPERATURE,
+        "n": samples_per_question,
+        "top_p": 1.0,
+    }
+
+async def process_prompt(args, semaphore, cache=None, cache_out=None, request_limiter=None, token_limiter=None,
+                         max_context_tokens=None):
+    idx, line, client, prompt_format, model, samples_per_question = args
+    print("Processing prompt", idx)
     
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": formatted_input}],
-        max_completion_tokens=16000,
-        temperature=1.0,
-        n=1,
-        top_p=1.0
-    )
+    request = build_request(line, prompt_format, model, samples_per_question)
+    messages = request["messages"]
     
-    content = extract_code_block(response.choices[0].message.content)
-    line['unit_test_responses'] = response.choices[0].message.content
-    line['unit_tests'] = content
+    key = cache_key(model, prompt_format, messages, samples_per_question) if cache is not None else None
+    if key is not None and key in cache:
+        response_content = cache[key]
+    else:
+        prompt_tokens = 0
+        if token_limiter is not None or max_context_tokens is not None:
+            prompt_tokens = count_prompt_tokens(request)
+        # A request that cannot fit in the model's context would only come back as an error.
+        if exceeds_context(request, prompt_tokens, max_context_tokens):
+            print(f"Skipping prompt {idx}: {prompt_tokens} prompt and {request['max_completion_tokens']} completion tokens "
+                  f"exceed the context of {max_context_tokens} tokens")
+            line['unit_test_responses'] = None
+            line['unit_tests'] = []
+            return line
+        async with semaphore:
+            if request_limiter is not None:
+                await request_limiter.acquire()
+            if token_limiter is not None:
+                # The provider counts the completion tokens a request may generate against the limit too.
+                await token_limiter.acquire(prompt_tokens + request["max_completion_tokens"] * request["n"])
+            response = await client.chat.completions.create(**request)
+        if samples_per_question == 1:
+            response_content = response.choices[0].message.content
+        else:
+            response_content = [choice.message.content for choice in response.choices]
+        if key is not None:
+            cache[key] = response_content
+            cache_out.write(json.dumps({"key": key, "content": response_content}, ensure_ascii=False) + "\n")
+    
+    attach_responses(line, response_content if samples_per_question != 1 else [response_content])
     print(f"Completed processing {idx + 1} prompts")
-    return json.dumps(line, ensure_ascii=False) + "\n"
+    return line
 
-def perform_inference(input_file, client, prompt_format, target_file, model):
-    input_lines = load_input_file(input_file)
-    args_list = [(i, line, client, prompt_format, model) for i, line in enumerate(input_lines)]
-    buffer = []
+async def copy_responses(line, first):
+    """
+    Give line the responses of the identical prompt processed by the task first.
+    """
+    first_line = await first
+    line['unit_test_responses'] = first_line['unit_test_responses']
+    line['unit_tests'] = first_line['unit_tests']
+    return line
+
+async def perform_inference(input_file, client, prompt_format, target_file, model, max_concurrency, cache_file=None,
+                            rpm=None, tpm=None, samples_per_question=1, max_context_tokens=None, dedup=False):
+    stack = ExitStack()
+    # Responses are looked up in and appended to the cache file, if one is given.
+    cache = None
+    cache_out = None
+    if cache_file is not None:
+        os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+        cache = load_cache(cache_file)
+        cache_out = stack.enter_context(open(cache_file, "a", encoding="utf-8"))
+
+    # The calls are I/O-bound, so they all run concurrently on one event loop, at most max_concurrency at a time.
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # Requests are additionally paced to stay under the provider's per-minute request and token limits.
+    request_limiter = RateLimiter(rpm) if rpm else None
+    token_limiter = RateLimiter(tpm) if tpm else None
+    # Input lines are streamed in, with at most MAX_PENDING_TASKS scheduled but not yet written.
+    pending = deque()
+    written = 0
+
+    # With dedup, identical prompts are sent once and their later copies reuse the responses. The copies of
+    # each prompt are counted up front, so the first task is only kept until its last copy is scheduled.
+    remaining = Counter(prompt_digest(line, prompt_format) for line in iter_input_file(input_file)) if dedup else None
+    shared = {}
     
-    with open(target_file, "w", encoding="utf-8") as fout:
-        # Increase max_workers as appropriate since these calls are I/O-bound.
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            for i, result in enumerate(executor.map(process_prompt, args_list)):
-                buffer.append(result)
-                # Write out every 100 results to limit memory usage.
-                if (i + 1) % 100 == 0:
-                    fout.write("".join(buffer))
-                    fout.flush()
-                    buffer = []
-        if buffer:
-            fout.write("".join(buffer))
-            fout.flush()
+    with stack, open(target_file, "wb") as fout:
+        def write_result(line):
+            nonlocal written
+            fout.write(encode_line(line))
+            written += 1
+            # Flush every 100 results so progress reaches the disk.
+            if written % 100 == 0:
+                fout.flush()
+
+        # Results are written in input order as they become available.
+        for i, line in enumerate(iter_input_file(input_file)):
+            digest = prompt_digest(line, prompt_format) if dedup else None
+            if digest in shared:
+                task = asyncio.create_task(copy_responses(line, shared[digest]))
+            else:
+                task = asyncio.create_task(process_prompt((i, line, client, prompt_format, model, samples_per_question), semaphore, cache, cache_out,
+                                                          request_limiter, token_limiter, max_context_tokens))
+            if digest is not None:
+                remaining[digest] -= 1
+                if remaining[digest]:
+                    shared.setdefault(digest, task)
+                else:
+                    del remaining[digest]
+                    shared.pop(digest, None)
+            pending.append(task)
+            if len(pending) >= MAX_PENDING_TASKS:
+                write_result(await pending.popleft())
+        while pending:
+            write_result(await pending.popleft())
     
     print("Completed processing all prompts, written to", target_file)
 
+async def perform_batch_inference(input_file, client, prompt_format, target_file, model, samples_per_question=1,
+                                  max_context_tokens=None, dedup=False):
+    """
+    Run all prompts through the OpenAI Batch API and write the results in input order.
+    The batch request file is kept next to target_file. Prompts that exceed max_context_tokens
+    are left out of the batch and written without responses. With dedup, identical prompts are
+    only requested once and share the responses.
+    """
+    batch_input_file = target_file + ".batch_input.jsonl"
+    # Index of the line whose request answers each line; custom_id is the index of that line.
+    source_index = []
+    first_index = {}
+    with open(batch_input_file, "wb") as fbatch:
+        for i, line in enumerate(iter_input_file(input_file)):
+            if dedup:
+                digest = prompt_digest(line, prompt_format)
+                source_index.append(first_index.setdefault(digest, i))
+                if first_index[digest] != i:
+                    continue
+            else:
+                source_index.append(i)
+            request = build_request(line, prompt_format, model, samples_per_question)
+            if max_context_tokens is not None:
+                prompt_tokens = count_prompt_tokens(request)
+                if exceeds_context(request, prompt_tokens, max_context_tokens):
+                    print(f"Skipping prompt {i}: {prompt_tokens} prompt and {request['max_completion_tokens']} completion tokens "
+                          f"exceed the context of {max_context_tokens} tokens")
+                    continue
+            fbatch.write(orjson.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": request,
+            }, option=orjson.OPT_APPEND_NEWLINE))
+
+    with open(batch_input_file, "rb") as fbatch:
+        uploaded = await client.files.create(file=fbatch, purpose="batch")
+    batch = await client.batches.create(input_file_id=uploaded.id, endpoint="/v1/chat/completions", completion_window="24h")
+    print("Submitted batch", batch.id)
+
+    while batch.status not in BATCH_FINAL_STATUSES:
+        await asyncio.sleep(BATCH_POLL_INTERVAL)
+        batch = await client.batches.retrieve(batch.id)
+        print(f"Batch {batch.id} is {batch.status}: {batch.request_counts}")
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+
+    # Results come back in arbitrary order and are matched to input lines by custom_id.
+    responses = {}
+    if batch.output_file_id is not None:
+        output = await client.files.content(batch.output_file_id)
+        for raw in output.content.splitlines():
+            result = orjson.loads(raw)
+            if result.get("error") is None and result["response"]["status_code"] == 200:
+                choices = result["response"]["body"]["choices"]
+                responses[result["custom_id"]] = [choice["message"]["content"] for choice in choices]
+
+    failed = 0
+    with open(target_file, "wb") as fout:
+        for i, line in enumerate(iter_input_file(input_file)):
+            response_contents = responses.get(str(source_index[i]))
+            if response_contents is None:
+                failed += 1
+                line['unit_test_responses'] = None
+                line['unit_tests'] = []
+            else:
+                attach_responses(line, response_contents)
+            fout.write(encode_line(line))
+
+    print(f"Completed processing all prompts ({failed} failed), written to", target_file)
+
 def main():
     parser = argparse.ArgumentParser(description="Generate test cases for synthetic code scoring")
     parser.add_argument("--prompt_format", type=str, required=True, help="Prompt format to use, either instruction_only or instruction_solution")
     parser.add_argument("--model", type=str, required=True, help="Model to use for inference")
     parser.add_argument("--input_file", type=str, required=True, help="Path to the input file")
     parser.add_argument("--output_file", type=str, required=True, help="Path to the output file")
+    parser.add_argument("--mode", type=str, default="realtime", choices=["realtime", "batch"],
+                        help="Send requests directly (realtime) or through the OpenAI Batch API (batch)")
+    parser.add_argument("--max_concurrency", type=int, default=100, help="Maximum number of concurrent API requests")
+    parser.add_argument("--samples_per_question", type=int, default=1,
+                        help="Number of test case responses sampled per question in a single request")
+    parser.add_argument("--max_context_tokens", type=int, default=None,
+                        help="Skip prompts whose tokens plus the completion budget exceed this context size "
+                             "(counted with tiktoken if installed)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Send repeated prompts once and copy their responses to every repeat; "
+                             "with temperature > 0 the repeats then share one sample instead of drawing their own")
+    parser.add_argument("--rpm", type=int, default=None, help="Maximum API requests per minute (default: unlimited)")
+    parser.add_argument("--tpm", type=int, default=None, help="Maximum API tokens per minute (default: unlimited)")
+    parser.add_argument("--cache_file", type=str, default=DEFAULT_CACHE_FILE, help="Path to the on-disk response cache (realtime mode)")
+    parser.add_argument("--no_cache", action="store_true", help="Disable the on-disk response cache")
+    parser.add_argument("--cache_nondeterministic", action="store_true",
+                        help="Reuse cached responses even though they are sampled with temperature > 0")
     args = parser.parse_args()
 
     prompt_format = args.prompt_format
     model = args.model
     input_file = args.input_file
     output_file = args.output_file
+    max_concurrency = args.max_concurrency
+    samples_per_question = args.samples_per_question
+
+    # Sampled responses differ between runs, so reusing them has to be requested explicitly.
+    cache_file = None
+    if not args.no_cache:
+        if TEMPERATURE == 0 or args.cache_nondeterministic:
+            cache_file = args.cache_file
+        else:
+            print(f"Response cache disabled since temperature={TEMPERATURE}; pass --cache_nondeterministic to use it.")
 
     client = initialize_openai_client(api_key=os.environ['OPENAI_API_KEY'])
-    perform_inference(input_file, client, prompt_format, output_file, model)
+    run = uvloop.run if uvloop is not None else asyncio.run
+    if args.mode == "batch":
+        run(perform_batch_inference(input_file, client, prompt_format, output_file, model, samples_per_question,
+                                    args.max_context_tokens, args.dedup))
+    else:
+        run(perform_inference(input_file, client, prompt_format, output_file, model, max_concurrency, cache_file,
+                              args.rpm, args.tpm, samples_per_question, args.max_context_tokens, args.dedup))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
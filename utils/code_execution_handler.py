@@ -1,6 +1,127 @@
 # SPDX-License-Identifier: MIT
 
-def local_code_execution(completion, unit_tests, timeout=3):
+import copy
+import io
+import json
+import os
+import pickle
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+
+# Address space cap for sandboxed executions, in bytes.
+SANDBOX_MEMORY_LIMIT = 4 << 30
+# Allowance on top of the summed test timeouts for interpreter startup and teardown, in seconds.
+SANDBOX_STARTUP_TIMEOUT = 5.0
+
+# Globals every test starts from; each test runs in its own copy.
+BASE_GLOBALS = {"__builtins__": __builtins__}
+
+# Test harness run by sandboxed_code_execution in a fresh interpreter. It reads the pickled
+# (handler_dir, completion, unit_tests, timeouts, entry_point, result_wrapper) from stdin, runs the
+# tests with run_unit_tests imported from this module, and writes one JSON line of
+# [correct, stdout, stderr, traceback, time_taken] per test to the original stdout, which is
+# detached from the test code's file descriptors 1 and 2.
+SANDBOX_SCRIPT = r"""
+import json, os, pickle, sys
+
+results = os.fdopen(os.dup(1), "w")
+devnull = os.open(os.devnull, os.O_WRONLY)
+os.dup2(devnull, 1)
+os.dup2(devnull, 2)
+handler_dir, completion, unit_tests, timeouts, entry_point, result_wrapper = pickle.load(sys.stdin.buffer)
+sys.path.insert(0, handler_dir)
+from code_execution_handler import run_unit_tests
+
+for result in run_unit_tests(completion, unit_tests, timeouts, entry_point, result_wrapper):
+    results.write(json.dumps(result) + "\n")
+    results.flush()
+"""
+
+def format_test_traceback(e):
+    """
+    Format the traceback of an exception raised by a test without the leading frames of this
+    harness, so it starts at the solution or test code ("<string>") that raised it.
+    """
+    frames = traceback.extract_tb(e.__traceback__)
+    harness_file = format_test_traceback.__code__.co_filename
+    start = 0
+    while start < len(frames) and frames[start].filename == harness_file:
+        start += 1
+    return "".join(traceback.format_list(frames[start:]) + traceback.format_exception_only(type(e), e))
+
+def run_unit_tests(completion, unit_tests, timeouts, entry_point=None, result_wrapper=None):
+    """
+    Run each unit test against the completion in fresh globals, with the matching entry of timeouts,
+    and yield (correct, stdout, stderr, traceback, time_taken) per test.
+    unit_tests are Python source snippets, or argument lists for entry_point when it is given;
+    those are called directly and their (result_wrapper applied) result printed to stdout.
+    This is the loop shared by local_code_execution and the sandboxed child interpreter.
+    """
+    # The solution is parsed and compiled once; every test still runs it in fresh globals.
+    # A solution that does not compile fails every test with its SyntaxError.
+    try:
+        solution_code = compile(completion, "<string>", "exec")
+        solution_error = None
+    except SyntaxError as e:
+        solution_code = None
+        solution_error = e
+    # Tests frequently repeat, so each distinct test is compiled only once. They are padded
+    # to the line numbers they would have had appended to the solution, as errors report those.
+    test_codes = {}
+    line_padding = "\n" * completion.count("\n")
+    # Test output is captured into the same two buffers, emptied before every test.
+    out_buf = io.StringIO()
+    err_buf = io.StringIO()
+
+    for inp, timeout in zip(unit_tests, timeouts):
+        start = time.time()
+        out_buf.seek(0)
+        out_buf.truncate()
+        err_buf.seek(0)
+        err_buf.truncate()
+
+        custom_globals = BASE_GLOBALS.copy()
+        try:
+            with redirect_stdout(out_buf), redirect_stderr(err_buf), time_limit(timeout):
+                if solution_error is not None:
+                    raise solution_error.with_traceback(None)
+                if entry_point is None:
+                    if inp not in test_codes:
+                        test_codes[inp] = compile(line_padding + inp, "<string>", "exec")
+                    exec(solution_code, custom_globals)
+                    exec(test_codes[inp], custom_globals)
+                else:
+                    exec(solution_code, custom_globals)
+                    if entry_point not in custom_globals:
+                        raise NameError(f"name '{entry_point}' is not defined")
+                    # Arguments are copied so a solution that mutates them cannot alter the stored inputs.
+                    result = custom_globals[entry_point](*copy.deepcopy(inp))
+                    print(result if result_wrapper is None else result_wrapper(result))
+
+            err = err_buf.getvalue()
+            correct = err == ''
+            # No exception is being handled here, so there is no traceback to format.
+            tb = ""
+
+        except Exception as e:
+            correct = False
+            err = repr(e)
+            tb = format_test_traceback(e)
+
+        yield correct, out_buf.getvalue(), err, tb, time.time() - start
+
+def local_code_execution(completion, unit_tests, timeout=3, timeouts_list=None, entry_point=None, result_wrapper=None):
+    """
+    Run each unit test against the completion in fresh globals, see run_unit_tests.
+    Each test gets timeout seconds, or its own entry of timeouts_list when that is given.
+    """
     output_dict = {
         "correct_tests": [],
         "average_test_score": 0.0,
@@ -8,41 +129,26 @@ def local_code_execution(completion, unit_tests, timeout=3):
         "unit_test_stderrs": [],
         "traceback": [],
         "time_taken": [],
+        "had_stderr": False,
     }
 
+    timeouts = list(timeouts_list) if timeouts_list else [timeout] * len(unit_tests)
+
     with create_tempdir():
         # These system calls are needed when cleaning up tempdir.
         rmtree = shutil.rmtree
         rmdir = os.rmdir
         chdir = os.chdir
 
-        custom_globals = {"__builtins__": __builtins__}
-
-        for _, inp in enumerate(unit_tests):
-            start = time.time()
-
-            custom_globals = {"__builtins__": __builtins__}
-            try:
-                with time_limit(timeout):
-                    sys.stdout = io.StringIO()
-                    sys.stderr = io.StringIO()
-                    exec(completion + inp, custom_globals)
-
-                err = sys.stderr.getvalue()
-                output_dict['correct_tests'].append(err == '')
-                output_dict['unit_test_stderrs'].append(err)
-                output_dict['traceback'].append("\n".join(traceback.format_exc().split("\n")[3:]))
-
-            except Exception as e:
-                output_dict['correct_tests'].append(False)
-                output_dict['unit_test_stderrs'].append(repr(e))
-                output_dict['traceback'].append("\n".join(traceback.format_exc().split("\n")[3:]))
-
-            finally:
-                out = sys.stdout.getvalue()
-                err = sys.stderr.getvalue()
-                output_dict['time_taken'].append(time.time() - start)
-                output_dict['unit_test_stdouts'].append(out)
+        for correct, out, err, tb, time_taken in run_unit_tests(completion, unit_tests, timeouts,
+                                                                entry_point, result_wrapper):
+            output_dict['correct_tests'].append(correct)
+            output_dict['unit_test_stderrs'].append(err)
+            if err:
+                output_dict['had_stderr'] = True
+            output_dict['traceback'].append(tb)
+            output_dict['time_taken'].append(time_taken)
+            output_dict['unit_test_stdouts'].append(out)
 
         output_dict['average_test_score'] = (
             0.0
@@ -56,3 +162,76 @@ def local_code_execution(completion, unit_tests, timeout=3):
 
         return output_dict
 
+def sandboxed_code_execution(completion, unit_tests, timeout=3, timeouts_list=None, entry_point=None,
+                             result_wrapper=None, memory_limit=SANDBOX_MEMORY_LIMIT):
+    """
+    Same as local_code_execution, but all tests run in one short-lived child interpreter with an
+    address space limit, inside its own temporary directory and process group. The child is killed
+    outright when it overruns its time budget or dies, and the tests it did not report fail.
+    """
+    output_dict = {
+        "correct_tests": [],
+        "average_test_score": 0.0,
+        "unit_test_stdouts": [],
+        "unit_test_stderrs": [],
+        "traceback": [],
+        "time_taken": [],
+        "had_stderr": False,
+    }
+
+    timeouts = list(timeouts_list) if timeouts_list else [timeout] * len(unit_tests)
+    # The child imports run_unit_tests from this file's directory, as -I leaves it off sys.path.
+    handler_dir = os.path.dirname(os.path.abspath(__file__))
+    payload = pickle.dumps((handler_dir, completion, list(unit_tests), timeouts, entry_point, result_wrapper))
+
+    def limit_resources():
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    with tempfile.TemporaryDirectory() as cwd:
+        # -I isolates the child from PYTHON* environment variables, the user site and the working directory.
+        process = subprocess.Popen(
+            [sys.executable, "-I", "-c", SANDBOX_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=cwd,
+            preexec_fn=limit_resources,
+            start_new_session=True,
+        )
+        try:
+            stdout, _ = process.communicate(payload, timeout=sum(timeouts) + SANDBOX_STARTUP_TIMEOUT)
+            failure = f"RuntimeError('Test process exited with code {process.returncode}')"
+        except subprocess.TimeoutExpired:
+            failure = repr(TimeoutError("Timed out!"))
+            os.killpg(process.pid, signal.SIGKILL)
+            stdout, _ = process.communicate()
+        finally:
+            # Also reap anything the tests left running in the child's process group.
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    reported = stdout.decode("utf-8", errors="replace").splitlines()
+    for i, inp_timeout in enumerate(timeouts):
+        try:
+            correct, out, err, tb, time_taken = json.loads(reported[i])
+        except (IndexError, ValueError):
+            # The child died or was killed during this test; only the first unreported test was running.
+            correct, out, err, tb = False, "", failure, ""
+            time_taken = inp_timeout if i == len(reported) else 0.0
+        output_dict['correct_tests'].append(correct)
+        output_dict['unit_test_stdouts'].append(out)
+        output_dict['unit_test_stderrs'].append(err)
+        if err:
+            output_dict['had_stderr'] = True
+        output_dict['traceback'].append(tb)
+        output_dict['time_taken'].append(time_taken)
+
+    output_dict['average_test_score'] = (
+        0.0
+        if len(output_dict['correct_tests']) == 0
+        else (sum(output_dict['correct_tests']) / len(output_dict['correct_tests']))
+    )
+
+    return output_dict
@@ -0,0 +1,100 @@
+# SPDX-License-Identifier: MIT
+
+# JSONL reading helpers shared by the scripts that stream large datasets.
+
+import json
+import mmap
+import os
+import re
+
+import orjson
+
+READ_BUFFER_SIZE = 1 << 20
+
+# orjson only represents integers in [-2**63, 2**64) exactly; wider ones, such as the big test
+# inputs of HE+/MBPP+, become floats or are rejected. Any such literal has at least 20 digits,
+# or 19 after a minus sign, so lines containing one are parsed with json instead.
+WIDE_INT_PATTERN = re.compile(rb"\d{20}|-\d{19}")
+# json writes non-finite floats, such as the infinite test inputs of some MBPP+ tasks, as the bare
+# literals Infinity, -Infinity and NaN. orjson cannot read them and writes them back as null.
+NON_FINITE_PATTERN = re.compile(rb"Infinity|NaN")
+
+def iter_jsonl_bytes(f, bufsize=READ_BUFFER_SIZE):
+    """
+    Yield the raw lines of a JSONL file opened in binary mode, reading it in bufsize chunks.
+    Lines are bytes without the trailing newline, ready for loads.
+    """
+    buf = b""
+    while chunk := f.read(bufsize):
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        yield from lines
+    if buf:
+        yield buf
+
+def iter_mmap_lines(filename):
+    """
+    Yield the lines of a file as bytes without their newline, reading it through a read-only memory map.
+    """
+    with open(filename, 'rb') as f:
+        # Empty files cannot be memory-mapped.
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            end = len(mm)
+            while start < end:
+                newline = mm.find(b"\n", start)
+                if newline < 0:
+                    newline = end
+                yield mm[start:newline]
+                start = newline + 1
+
+def needs_json(line):
+    """
+    Returns True if the raw JSONL line (bytes) may hold values orjson cannot round-trip:
+    integers wider than 64 bits or non-finite floats.
+
+    >>> needs_json(b'{"base_input": [[1, Infinity]]}')
+    True
+    >>> needs_json(b'{"base_input": [[1, 2.5]]}')
+    False
+    """
+    return WIDE_INT_PATTERN.search(line) is not None or NON_FINITE_PATTERN.search(line) is not None
+
+def loads(line):
+    """
+    Parse one JSONL line (bytes) with orjson, falling back to json for what orjson cannot read
+    exactly: integers wider than 64 bits and the Infinity/NaN literals json writes for
+    non-finite floats (such as infinite time sentinels).
+
+    >>> loads(b'{"base_input": [[1180591620717411303424], [-9223372036854775809]]}')
+    {'base_input': [[1180591620717411303424], [-9223372036854775809]]}
+    >>> loads(b'{"average_time_taken": Infinity}')
+    {'average_time_taken': inf}
+    """
+    if not needs_json(line):
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(line)
+
+def dumps(obj, use_json=False):
+    """
+    Serialize obj as a newline-terminated JSONL line (bytes) with orjson, falling back to json
+    for integers wider than 64 bits, which orjson refuses to write.
+    orjson writes non-finite floats as null, so callers pass use_json=True when obj may hold them,
+    e.g. when needs_json is True for the line it was read from.
+
+    >>> dumps({"base_input": [[2 ** 70]]})
+    b'{"base_input": [[1180591620717411303424]]}\\n'
+    >>> dumps({"base_input": [[1, float("inf")]]}, use_json=True)
+    b'{"base_input": [[1, Infinity]]}\\n'
+    """
+    if not use_json:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+        except orjson.JSONEncodeError:
+            pass
+    return (json.dumps(obj) + "\n").encode("utf-8")
@@ -5,128 +5,129 @@ import os
 MBPP_PLUS_VERSION = "v0.2.0"
 MBPP_OVERRIDE_PATH = os.environ.get("MBPP_OVERRIDE_PATH", None)
 
+def serialize_sets(inputs: list) -> list:
+    return [[[list(item) for item in inp[0]]] for inp in inputs]
+
+
+def serialize_float_complex(inputs: list) -> list:
+    return [(str(inp[0]), str(inp[1])) for inp in inputs]
+
+
+def serialize_complex(inputs: list) -> list:
+    return [[str(inp[0])] for inp in inputs]
+
+
+# Task number -> serializer; tasks not listed are passed through unchanged.
+MBPP_SERIALIZERS = {
+    115: serialize_sets,
+    124: serialize_float_complex,
+    252: serialize_complex,
+}
+
+
 def mbpp_serialize_inputs(task_id: str, inputs: list) -> list:
-    task_id = int(task_id.split("/")[-1])
+    serializer = MBPP_SERIALIZERS.get(int(task_id.split("/")[-1]))
+    return inputs if serializer is None else serializer(inputs)
 
-    if task_id == 115:
-        return [[[list(item) for item in inp[0]]] for inp in inputs]
-    elif task_id == 124:
-        return [(str(inp[0]), str(inp[1])) for inp in inputs]
-    elif task_id == 252:
-        return [[str(inp[0])] for inp in inputs]
 
-    return inputs
+def tuple_args(inputs: list) -> list:
+    return [[tuple(lst) for lst in inp] for inp in inputs]
 
 
-def mbpp_deserialize_inputs(task_id: str, inputs: list) -> list:
-    task_id = int(task_id.split("/")[-1])
-    if task_id in [
-        2,
-        116,
-        132,
-        143,
-        222,
-        261,
-        273,
-        394,
-        399,
-        421,
-        424,
-        429,
-        470,
-        560,
-        579,
-        596,
-        616,
-        630,
-        726,
-        740,
-        744,
-        809,
-    ]:
-        modified_inputs = [[tuple(lst) for lst in inp] for inp in inputs]
-
-    elif task_id in [
-        63,
-        64,
-        70,
-        94,
-        120,
-        237,
-        272,
-        299,
-        400,
-        409,
-        417,
-        438,
-        473,
-        614,
-        780,
-    ]:
-        modified_inputs = [
-            [[tuple(lst) for lst in lst_lst] for lst_lst in inp] for inp in inputs
-        ]
+def tuple_nested_args(inputs: list) -> list:
+    return [[[tuple(lst) for lst in lst_lst] for lst_lst in inp] for inp in inputs]
 
-    elif task_id in [75, 413, 444, 753]:
-        modified_inputs = [
-            [[tuple(lst) for lst in inp[0]]] + [inp[1]] for inp in inputs
-        ]
 
-    elif task_id == 106 or task_id == 750:
-        modified_inputs = [[inp[0]] + [tuple(inp[1])] for inp in inputs]
+def tuple_first_arg_items(inputs: list) -> list:
+    return [[[tuple(lst) for lst in inp[0]]] + [inp[1]] for inp in inputs]
+
+
+def tuple_second_arg(inputs: list) -> list:
+    return [[inp[0]] + [tuple(inp[1])] for inp in inputs]
+
 
-    elif task_id == 115:
-        modified_inputs = [
+def deserialize_sets(inputs: list) -> list:
+    return [
+        [
             [
-                [
-                    set(item) if isinstance(item, list) and len(item) else {}
-                    for item in inp[0]
-                ]
+                set(item) if isinstance(item, list) and len(item) else {}
+                for item in inp[0]
             ]
-            for inp in inputs
         ]
+        for inp in inputs
+    ]
 
-    elif task_id == 124:
-        modified_inputs = [(float(inp[0]), complex(inp[1])) for inp in inputs]
 
-    elif task_id in [250, 405, 446, 617, 720, 763, 808]:
-        modified_inputs = [[tuple(inp[0])] + [inp[1]] for inp in inputs]
+def deserialize_float_complex(inputs: list) -> list:
+    return [(float(inp[0]), complex(inp[1])) for inp in inputs]
 
-    elif task_id in [259, 401, 445]:
-        modified_inputs = [
-            [[tuple(lst) for lst in lst_lst] for lst_lst in inp] for inp in inputs
-        ]
-        modified_inputs = [[tuple(lst) for lst in inp] for inp in modified_inputs]
 
-    elif task_id == 278:
-        modified_inputs = [
-            [[tuple(item) if isinstance(item, list) else item for item in inp[0]]]
-            for inp in inputs
-        ]
-        modified_inputs = [[tuple(lst) for lst in inp] for inp in modified_inputs]
+def tuple_first_arg(inputs: list) -> list:
+    return [[tuple(inp[0])] + [inp[1]] for inp in inputs]
 
-    elif task_id == 307:
-        modified_inputs = [[tuple(inp[0])] + [inp[1], inp[2]] for inp in inputs]
 
-    elif task_id == 722:
-        modified_inputs = [
-            [{key: tuple(value) for key, value in inp[0].items()}] + inp[1:]
-            for inp in inputs
-        ]
+def tuple_nested_args_twice(inputs: list) -> list:
+    return tuple_args(tuple_nested_args(inputs))
+
+
+def tuple_first_arg_lists(inputs: list) -> list:
+    modified_inputs = [
+        [[tuple(item) if isinstance(item, list) else item for item in inp[0]]]
+        for inp in inputs
+    ]
+    return tuple_args(modified_inputs)
+
+
+def tuple_first_of_three_args(inputs: list) -> list:
+    return [[tuple(inp[0])] + [inp[1], inp[2]] for inp in inputs]
 
-    elif task_id == 252:
-        modified_inputs = [[complex(inp[0])] for inp in inputs]
 
-    elif task_id in [580, 615, 791]:
+def tuple_dict_values(inputs: list) -> list:
+    return [
+        [{key: tuple(value) for key, value in inp[0].items()}] + inp[1:]
+        for inp in inputs
+    ]
 
-        def turn_all_list_into_tuple(inp):
-            if isinstance(inp, list):
-                return tuple([turn_all_list_into_tuple(item) for item in inp])
-            return inp
 
-        modified_inputs = [turn_all_list_into_tuple(inp) for inp in inputs]
+def deserialize_complex(inputs: list) -> list:
+    return [[complex(inp[0])] for inp in inputs]
 
-    else:
-        modified_inputs = inputs
 
-    return modified_inputs
+def turn_all_list_into_tuple(inp):
+    if isinstance(inp, list):
+        return tuple([turn_all_list_into_tuple(item) for item in inp])
+    return inp
+
+
+def tuple_all_lists(inputs: list) -> list:
+    return [turn_all_list_into_tuple(inp) for inp in inputs]
+
+
+# Task number -> deserializer, looked up once per call instead of walking a chain of
+# membership tests; tasks not listed are passed through unchanged.
+MBPP_DESERIALIZERS = {
+    **dict.fromkeys(
+        [2, 116, 132, 143, 222, 261, 273, 394, 399, 421, 424, 429, 470, 560, 579, 596, 616, 630, 726, 740, 744, 809],
+        tuple_args,
+    ),
+    **dict.fromkeys(
+        [63, 64, 70, 94, 120, 237, 272, 299, 400, 409, 417, 438, 473, 614, 780],
+        tuple_nested_args,
+    ),
+    **dict.fromkeys([75, 413, 444, 753], tuple_first_arg_items),
+    **dict.fromkeys([106, 750], tuple_second_arg),
+    115: deserialize_sets,
+    124: deserialize_float_complex,
+    **dict.fromkeys([250, 405, 446, 617, 720, 763, 808], tuple_first_arg),
+    **dict.fromkeys([259, 401, 445], tuple_nested_args_twice),
+    278: tuple_first_arg_lists,
+    307: tuple_first_of_three_args,
+    722: tuple_dict_values,
+    252: deserialize_complex,
+    **dict.fromkeys([580, 615, 791], tuple_all_lists),
+}
+
+
+def mbpp_deserialize_inputs(task_id: str, inputs: list) -> list:
+    deserializer = MBPP_DESERIALIZERS.get(int(task_id.split("/")[-1]))
+    return inputs if deserializer is None else deserializer(inputs)
@@ -2,9 +2,10 @@
 
 import argparse
 import json
+import multiprocessing
 import time
 from concurrent.futures import ProcessPoolExecutor, as_completed
-from code_execution_handler import local_code_execution
+from code_execution_handler import local_code_execution, sandboxed_code_execution
 from mbpp_handler import mbpp_deserialize_inputs
 import sys
 
@@ -14,7 +15,7 @@ TIMEOUT_MULTIPLE = 4.0
 TIMEOUT_MIN = 0.1
 
 # Function to process a single data item
-def process_line(index, line, dataset_type="HE", add_prompt=True, timeout=30, timeouts_list=False):
+def process_line(index, line, dataset_type="HE", add_prompt=True, timeout=30, timeouts_list=False, sandbox=False):
     
     start_time = time.time()
     if type(line) == dict:
@@ -45,47 +46,22 @@ def process_line(index, line, dataset_type="HE", add_prompt=True, timeout=30, ti
         base_input = data.get("base_input", [])
         plus_input = data.get("plus_input", [])
 
+    # HE and MBPP+ tests call the entry point directly with the input arguments; MBPP tests are assert statements.
+    entry_point = None
+    result_wrapper = None
+
     if dataset_type == "HE":
-        base_unit_tests = [
-            f"\nprint({data['entry_point']}(*{inputs}))"
-            for inputs in base_input
-        ]
-        plus_unit_tests = [
-            f"\nprint({data['entry_point']}(*{inputs}))"
-            for inputs in plus_input
-        ]
+        entry_point = data["entry_point"]
+        base_unit_tests = base_input
+        plus_unit_tests = plus_input
 
     if dataset_type == "MBPP+":
-        base_input = mbpp_deserialize_inputs(data["task_id"], base_input)
-        plus_input = mbpp_deserialize_inputs(data["task_id"], plus_input)
-
-        base_unit_tests = [
-            f"\nprint({data['entry_point']}(*{inputs}))"
-            for inputs in base_input
-        ]
-        plus_unit_tests = [
-            f"\nprint({data['entry_point']}(*{inputs}))"
-            for inputs in plus_input
-        ]
-
-
-        if data["task_id"] == "Mbpp/404":
-            base_unit_tests = [ "\nfrom math import inf\n" + inputs
-                for inputs in base_unit_tests
-            ]
-            plus_unit_tests = [ "\nfrom math import inf\n" + inputs
-                for inputs in plus_unit_tests
-            ]
+        entry_point = data["entry_point"]
+        base_unit_tests = mbpp_deserialize_inputs(data["task_id"], base_input)
+        plus_unit_tests = mbpp_deserialize_inputs(data["task_id"], plus_input)
 
         if data["task_id"] in ["Mbpp/737", "Mbpp/787", "Mbpp/794"]:
-            base_unit_tests = [
-                f"\nprint(bool({data['entry_point']}(*{inputs})))"
-                for inputs in base_input
-            ]
-            plus_unit_tests = [
-                f"\nprint(bool({data['entry_point']}(*{inputs})))"
-                for inputs in plus_input
-            ]
+            result_wrapper = bool
 
     if timeouts_list:
         base_timeouts_list = [max(TIMEOUT_MIN, x * TIMEOUT_MULTIPLE) for x in data['base_execution_result']['time_taken']]
@@ -94,16 +70,24 @@ def process_line(index, line, dataset_type="HE", add_prompt=True, timeout=30, ti
         base_timeouts_list = None
         plus_timeouts_list = None
 
+    # Sandboxed tests run in a separate, hard-killable interpreter instead of this worker.
+    code_execution = sandboxed_code_execution if sandbox else local_code_execution
+
     # Execute base_input tests
-    base_results = local_code_execution(combined_solution, base_unit_tests, timeout=timeout, timeouts_list=base_timeouts_list)
+    base_results = code_execution(combined_solution, base_unit_tests, timeout=timeout, timeouts_list=base_timeouts_list,
+                                  entry_point=entry_point, result_wrapper=result_wrapper)
     data["base_execution_result"] = base_results
 
     # Execute plus_input tests
-    plus_results = local_code_execution(combined_solution, plus_unit_tests, timeout=timeout, timeouts_list=plus_timeouts_list)
+    plus_results = code_execution(combined_solution, plus_unit_tests, timeout=timeout, timeouts_list=plus_timeouts_list,
+                                  entry_point=entry_point, result_wrapper=result_wrapper)
     data["plus_execution_result"] = plus_results
 
     # Check for errors and flag the task_id if needed
-    if any(base_results.get("unit_test_stderrs", [])) or any(plus_results.get("unit_test_stderrs", [])):
+    # had_stderr is only used here and is not written out with the results.
+    base_had_stderr = base_results.pop("had_stderr")
+    plus_had_stderr = plus_results.pop("had_stderr")
+    if base_had_stderr or plus_had_stderr:
         print(f"Error in task_id: {data['task_id']}")
 
     if dataset_type == "MBPP":
@@ -111,14 +95,25 @@ def process_line(index, line, dataset_type="HE", add_prompt=True, timeout=30, ti
 
     return index, json.dumps(data), time.time() - start_time
 
+def previous_time_taken(data):
+    return sum(data['base_execution_result']['time_taken']) + sum(data['plus_execution_result']['time_taken'])
+
 # Main function to process data with parallelization
-def process_data(lines, output_file, dataset_type="HE", add_prompt=True, timeout=30, timeouts_list=False):
+def process_data(lines, output_file, dataset_type="HE", add_prompt=True, timeout=30, timeouts_list=False, sandbox=False):
 
     count = 0
     results = []
 
-    with ProcessPoolExecutor(max_workers=8) as executor:
-        future_to_index = {executor.submit(process_line, i, line, dataset_type, add_prompt, timeout, timeouts_list): i for i, line in enumerate(lines)}
+    order = range(len(lines))
+    if timeouts_list:
+        # Previous execution times are known, so submit the slowest lines first (longest-processing-time
+        # scheduling) to keep a few slow lines from starting last and leaving the other workers idle.
+        lines = [line if type(line) == dict else json.loads(line.strip()) for line in lines]
+        order = sorted(order, key=lambda i: -previous_time_taken(lines[i]))
+
+    # Forked workers start from the already-initialized parent interpreter instead of a fresh one.
+    with ProcessPoolExecutor(max_workers=8, mp_context=multiprocessing.get_context("fork")) as executor:
+        future_to_index = {executor.submit(process_line, i, lines[i], dataset_type, add_prompt, timeout, timeouts_list, sandbox): i for i in order}
 
         for future in as_completed(future_to_index):
             index = future_to_index[future]
@@ -152,6 +147,7 @@ if __name__ == "__main__":
     parser.add_argument("--timeout", type=int, default=30, help="Timeout for each execution")
     parser.add_argument("--add_prompt", type=bool, default=True, help="Whether to add prompt")
     parser.add_argument("--timeouts_list", type=bool, default=False, help="Whether to use timeouts list")
+    parser.add_argument("--sandbox", action="store_true", help="Run the tests in a resource-limited subprocess")
 
     args = parser.parse_args()
 
@@ -161,9 +157,11 @@ if __name__ == "__main__":
     timeout = args.timeout
     add_prompt = args.add_prompt
     timeouts_list = args.timeouts_list
+    sandbox = args.sandbox
 
     print("Processing data...")
     with open(input_file, 'r') as f:
         lines = f.readlines()
 
-    process_data(lines, output_file, dataset_type, timeout)
+    process_data(lines, output_file, dataset_type, add_prompt=add_prompt, timeout=timeout,
+                 timeouts_list=timeouts_list, sandbox=sandbox)